@@ -0,0 +1,125 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Compare cold and warm BZQL parse times, and parser backends.
+
+Run from the top of the source tree with:
+
+    python -m benchmarks.bench_bzql
+
+Cold and disk-warm timings use the tatsu backend, and are each taken in a fresh
+interpreter because tatsu keeps its own in-process cache of compiled grammars.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from rhbztools import bzql
+
+QUERY = '''
+    classification = "Red Hat" &
+    product = "Red Hat OpenStack" &
+    cf_internal_whiteboard contains "DFG:Compute" &
+    not (
+      keywords contains "Documentation" |
+      component = "documentation"
+    ) &
+    flags contains "rhos-17.0+"
+'''
+
+def _parse_once(backend='tatsu', query=QUERY):
+    start = time.perf_counter()
+    bzql.parser(backend)(query)
+    return time.perf_counter() - start
+
+def _long_query(terms):
+    # Alternate and/or groups and negated subgroups of simple expressions
+    exprs = ['cf_internal_whiteboard substring "DFG:Compute{i}"'.format(i=i)
+             for i in range(terms)]
+    groups = [' and '.join(exprs[i:i + 4]) for i in range(0, terms, 4)]
+    return ' or '.join('not ({group})'.format(group=group)
+                       if i % 2 else group
+                       for (i, group) in enumerate(groups))
+
+def backends(cache_dir, repeat, terms):
+    query = _long_query(terms)
+    with mock.patch('rhbztools.picklecache.cache_dir', return_value=cache_dir):
+        timings = {}
+        for backend in ('tatsu', 'fast'):
+            _parse_once(backend, query)
+            timings[backend] = min(_parse_once(backend, query)
+                                   for _ in range(repeat))
+    return timings
+
+def _child(cache_dir):
+    with mock.patch('rhbztools.picklecache.cache_dir', return_value=cache_dir):
+        print(_parse_once())
+
+def _run_child(cache_dir):
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.bench_bzql',
+         '--child', cache_dir])
+    return float(output)
+
+def cold(cache_dir, repeat):
+    timings = []
+    for _ in range(repeat):
+        for f in os.listdir(cache_dir):
+            os.unlink(os.path.join(cache_dir, f))
+        timings.append(_run_child(cache_dir))
+    return min(timings)
+
+def disk_warm(cache_dir, repeat):
+    _run_child(cache_dir)
+    return min(_run_child(cache_dir) for _ in range(repeat))
+
+def warm(cache_dir, repeat):
+    with mock.patch('rhbztools.picklecache.cache_dir', return_value=cache_dir):
+        _parse_once()
+        return min(_parse_once() for _ in range(repeat))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.child is not None:
+        _child(opts.child)
+        return
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for scenario in (cold, disk_warm, warm):
+            elapsed = scenario(cache_dir, opts.repeat)
+            print('{name:10} {ms:10.3f} ms'.format(
+                    name=scenario.__name__, ms=elapsed * 1000))
+
+        print()
+        for terms in (1, 10, 100, 1000):
+            timings = backends(cache_dir, opts.repeat, terms)
+            print('{terms:4} terms: tatsu {tatsu:10.3f} ms  '
+                  'fast {fast:8.3f} ms  speedup {speedup:6.1f}x'.format(
+                    terms=terms, tatsu=timings['tatsu'] * 1000,
+                    fast=timings['fast'] * 1000,
+                    speedup=timings['tatsu'] / timings['fast']))
+
+if __name__ == '__main__':
+    main()
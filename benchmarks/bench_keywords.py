@@ -0,0 +1,119 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Compare Keywords.updater with the original word by word implementation.
+
+Run from the top of the source tree with:
+
+    python -m benchmarks.bench_keywords
+
+Both are run over the same synthetic whiteboards, and must give identical
+results. The reference is the original algorithm with one bug fixed: the
+original removed words it found from the words to add, so they were never
+added to any later whiteboard. Without that fix the two can't agree.
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_suite import _keywords, _whiteboards
+
+
+def reference_updater(keywords, add, remove):
+    # The original implementation of Keywords.updater, except that it copies
+    # add_set for each whiteboard instead of consuming it
+    add_set = keywords._to_canon_set(add)
+    remove_set = keywords._to_canon_set(remove)
+
+    def _updater(orig):
+        pending = set(add_set)  # Originally add_set itself
+        updated = False
+        output = []
+
+        for word in orig.split():
+            canon_word = keywords._to_canon(word)
+
+            # Ignore unrecognised words
+            if canon_word is None:
+                output.append(word)
+                continue
+
+            if canon_word in remove_set:
+                updated = True
+                continue
+
+            if canon_word in pending:
+                pending.remove(canon_word)
+                output.append(canon_word)
+                updated = updated or (word != canon_word)
+                continue
+
+            output.append(canon_word)
+            updated = updated or (word != canon_word)
+
+        for word in pending:
+            updated = True
+            output.append(word)
+
+        if not updated:
+            return None
+
+        return ' '.join(output)
+
+    return _updater
+
+def _time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return (min(timings), result)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-n', '--whiteboards', type=int, default=100000)
+    opts = parser.parse_args()
+
+    keywords = _keywords()
+    whiteboards = _whiteboards(opts.whiteboards)
+    (add, remove) = (['needsauto'], ['needsver'])
+
+    def _reference():
+        updater = reference_updater(keywords, add, remove)
+        return [updater(wb) for wb in whiteboards]
+
+    def _updater():
+        updater = keywords.updater(add, remove)
+        return [updater(wb) for wb in whiteboards]
+
+    def _update_all():
+        return keywords.updater(add, remove).update_all(whiteboards)
+
+    (baseline, expected) = _time(_reference, opts.repeat)
+    print('{name:12} {ms:10.3f} ms'.format(name='reference',
+                                           ms=baseline * 1000))
+    for (name, func) in (('updater', _updater), ('update_all', _update_all)):
+        (elapsed, result) = _time(func, opts.repeat)
+        if result != expected:
+            raise AssertionError('{name} differs from reference'.format(
+                                    name=name))
+        print('{name:12} {ms:10.3f} ms  speedup {speedup:6.1f}x'.format(
+                name=name, ms=elapsed * 1000, speedup=baseline / elapsed))
+
+if __name__ == '__main__':
+    main()
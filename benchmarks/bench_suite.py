@@ -0,0 +1,204 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Measure rhbztools throughput against a local mock bugzilla.
+
+Run from the top of the source tree with:
+
+    python -m benchmarks.bench_suite -o results.json
+
+and compare with an earlier run with --compare. Results are the best of
+--repeat runs of each scenario. See benchmarks.mockbz for the server.
+"""
+
+import argparse
+import datetime
+import json
+import os.path
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from benchmarks import mockbz
+from benchmarks.bench_bzql import QUERY, _long_query
+from rhbztools import bzql
+from rhbztools.bugzilla import Session
+from rhbztools.keywords import Keywords, LineReader
+
+# Keywords file for the keywords scenario: each keyword followed by its typos
+KEYWORDS = '''
+# Synthetic keywords
+NeedsAutomation needsauto automation
+NeedsManualVer needsver manualver
+Triaged triage
+TestOnly testonly
+Regression regress
+'''
+
+
+def _best(repeat, func):
+    # Return the best time of repeat calls to func
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+# Each scenario returns the time taken and the number of items processed
+
+def bzql_parse(opts, server):
+    # Parse distinct queries, bypassing the translation cache
+    queries = [QUERY + ' & bug_id > {i}'.format(i=i) for i in range(1000)]
+    queries.append(_long_query(100))
+    parse = bzql.parser()
+
+    seconds = _best(opts.repeat, lambda: [parse(q) for q in queries])
+    return (seconds, len(queries))
+
+def get_bugs_10k(opts, server):
+    bzids = range(1, 10001)
+    with server.session() as session:
+        seconds = _best(opts.repeat, lambda: list(session.get_bugs(
+                            bzids, fields=['status', 'cf_devel_whiteboard'])))
+    return (seconds, len(bzids))
+
+def _query(size, page_size=Session.PAGE_SIZE, **kwargs):
+    def _scenario(opts, server):
+        server.query_size = size
+        with server.session(**kwargs) as session:
+            seconds = _best(opts.repeat, lambda: list(session.query(
+                                'status = "NEW"', page_size=page_size)))
+        return (seconds, size)
+    return _scenario
+
+def update_bugs(opts, server):
+    bzids = range(1, 201)
+    with server.session(workers=opts.workers) as session:
+        seconds = _best(opts.repeat, lambda: session.update_bugs(
+                            bzids, {'cf_devel_whiteboard': 'Triaged'}))
+    return (seconds, len(bzids))
+
+def _whiteboards(n):
+    rng = random.Random(0)
+    words = ['NeedsAutomation', 'needsauto', 'NEEDSVER', 'Triaged', 'triage',
+             'testonly', 'Regression', 'DFG:Compute', 'unknown', 'Foo']
+    return [' '.join(rng.sample(words, rng.randint(0, 5))) for _ in range(n)]
+
+def _keywords():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'keywords')
+        with open(path, 'w') as f:
+            f.write(KEYWORDS)
+        return Keywords(LineReader(path))
+
+def keywords_updater(opts, server):
+    whiteboards = _whiteboards(100000)
+    keywords = _keywords()
+
+    def _run():
+        updater = keywords.updater(['needsauto'], ['needsver'])
+        return [updater(wb) for wb in whiteboards]
+
+    return (_best(opts.repeat, _run), len(whiteboards))
+
+def keywords_update_all(opts, server):
+    whiteboards = _whiteboards(100000)
+    keywords = _keywords()
+
+    def _run():
+        updater = keywords.updater(['needsauto'], ['needsver'])
+        return updater.update_all(whiteboards)
+
+    return (_best(opts.repeat, _run), len(whiteboards))
+
+SCENARIOS = {
+    'bzql_parse': bzql_parse,
+    'get_bugs_10k': get_bugs_10k,
+    'query_100': _query(100),
+    'query_1000': _query(1000),
+    'query_10000': _query(10000),
+    'query_10000_unpaged': _query(10000, page_size=None, stream=True),
+    'update_bugs_200': update_bugs,
+    'keywords_updater_100k': keywords_updater,
+    'keywords_update_all_100k': keywords_update_all,
+}
+
+def _version():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(opts):
+    results = {}
+    with mockbz.MockBugzilla(latency=opts.latency) as server:
+        for name in opts.scenario or SCENARIOS:
+            (seconds, items) = SCENARIOS[name](opts, server)
+            results[name] = {'seconds': seconds, 'items': items,
+                             'per_second': items / seconds}
+
+    return {
+        'version': _version(),
+        'python': platform.python_version(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'latency': opts.latency,
+        'repeat': opts.repeat,
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Seconds to delay each request to the server')
+    parser.add_argument('-w', '--workers', type=int, default=Session.WORKERS)
+    parser.add_argument('-s', '--scenario', action='append',
+                        choices=SCENARIOS.keys(),
+                        help='Scenario to run. May be given more than once. '
+                             'Default: all')
+    parser.add_argument('-o', '--output',
+                        help='Write results to OUTPUT as JSON')
+    parser.add_argument('--compare',
+                        help='Compare with results from an earlier run')
+    opts = parser.parse_args()
+
+    report = run(opts)
+
+    previous = {}
+    if opts.compare is not None:
+        with open(opts.compare) as f:
+            previous = json.load(f)['results']
+
+    for (name, result) in report['results'].items():
+        line = '{name:24} {ms:10.3f} ms {rate:12.0f}/s'.format(
+                    name=name, ms=result['seconds'] * 1000,
+                    rate=result['per_second'])
+        if name in previous:
+            line += '  {ratio:6.2f}x previous'.format(
+                        ratio=result['seconds'] / previous[name]['seconds'])
+        print(line)
+
+    if opts.output is not None:
+        with open(opts.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
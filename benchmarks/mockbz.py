@@ -0,0 +1,204 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""A local stand-in for the bugzilla REST API, serving synthetic bugs.
+
+It implements just enough of the API for Session:
+
+    GET /rest/valid_login
+    GET /rest/bug?id=...          the given bugs
+    GET /rest/bug?...             the first query_size bugs, paged by limit
+                                  and offset
+    PUT /rest/bug/<id>
+
+include_fields is honoured. Every request is delayed by latency seconds.
+"""
+
+import contextlib
+import http.server
+import json
+import os.path
+import random
+import tempfile
+import threading
+from unittest import mock
+import urllib.parse
+
+from rhbztools import bugzilla
+
+STATUSES = ('NEW', 'ASSIGNED', 'POST', 'MODIFIED', 'ON_QA', 'VERIFIED')
+COMPONENTS = ('openstack-nova', 'python-novaclient', 'openstack-placement',
+              'documentation')
+KEYWORDS = ('NeedsAutomation', 'NeedsManualVer', 'Triaged', 'TestOnly',
+            'Regression')
+
+
+def synthetic_bug(bzid):
+    """Return a bug with plausible, deterministic field values"""
+    rng = random.Random(bzid)
+    return {
+        'id': bzid,
+        'summary': 'Synthetic bug {bzid}: instance fails to {verb}'.format(
+                        bzid=bzid, verb=rng.choice(('boot', 'migrate',
+                                                    'resize'))),
+        'status': rng.choice(STATUSES),
+        'component': [rng.choice(COMPONENTS)],
+        'product': 'Red Hat OpenStack',
+        'classification': 'Red Hat',
+        'priority': rng.choice(('low', 'medium', 'high', 'urgent')),
+        'severity': rng.choice(('low', 'medium', 'high', 'urgent')),
+        'keywords': rng.sample(KEYWORDS, rng.randint(0, 2)),
+        'cf_devel_whiteboard': ' '.join(rng.sample(KEYWORDS,
+                                                   rng.randint(0, 3))),
+        'cf_internal_whiteboard': 'DFG:Compute',
+        'flags': [{'name': 'rhos-17.0', 'status': rng.choice('+?-')}],
+        'cc': ['user{n}@example.com'.format(n=n)
+               for n in range(rng.randint(0, 10))],
+        'assigned_to': 'user{n}@example.com'.format(n=rng.randint(0, 20)),
+        'creation_time': '2019-01-01T00:00:00Z',
+        'last_change_time': '2019-06-01T00:00:00Z',
+    }
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Keep connections alive, like bugzilla. Headers and body are written
+    # separately, so don't let Nagle's algorithm delay the body.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _parse(self):
+        self.server.mockbz.wait()
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.strip('/').split('/')
+        params = {k: v[-1] for (k, v) in
+                  urllib.parse.parse_qs(url.query).items()}
+        return (path, params)
+
+    def do_GET(self):
+        (path, params) = self._parse()
+        if path == ['rest', 'valid_login']:
+            self._reply({'result': True})
+        elif path == ['rest', 'bug']:
+            self._reply({'bugs': self.server.mockbz.bugs(params),
+                         'faults': []})
+        else:
+            self.send_error(404)
+
+    def do_PUT(self):
+        (path, _) = self._parse()
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if len(path) == 3 and path[:2] == ['rest', 'bug']:
+            self.server.mockbz.updates += 1
+            self._reply({'bugs': [{
+                'id': int(path[2]),
+                'changes': {field: {'added': value, 'removed': ''}
+                            for (field, value) in body.items()},
+            }]})
+        else:
+            self.send_error(404)
+
+
+class MockBugzilla:
+    def __init__(self, query_size=1000, latency=0.0):
+        super(MockBugzilla, self).__init__()
+
+        # The number of bugs returned by a query
+        self.query_size = query_size
+        # Seconds to delay each request
+        self.latency = latency
+        # The number of PUT requests received
+        self.updates = 0
+
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        (host, port) = self._server.server_address[:2]
+        return 'http://{host}:{port}/rest/'.format(host=host, port=port)
+
+    def wait(self):
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+    def bugs(self, params):
+        if 'id' in params:
+            bzids = [int(bzid) for bzid in params['id'].split(',')]
+        else:
+            offset = int(params.get('offset', 0))
+            limit = int(params.get('limit', self.query_size))
+            end = min(self.query_size, offset + limit)
+            bzids = range(offset + 1, end + 1)
+
+        bugs = [synthetic_bug(bzid) for bzid in bzids]
+
+        include_fields = params.get('include_fields')
+        if include_fields is not None:
+            fields = include_fields.split(',')
+            bugs = [{field: bug[field] for field in fields if field in bug}
+                    for bug in bugs]
+        return bugs
+
+    def start(self):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                       _Handler)
+        self._server.daemon_threads = True
+        self._server.mockbz = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextlib.contextmanager
+    def session(self, **kwargs):
+        """Yield a bugzilla.Session which talks to this server"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            auth_file = os.path.join(tmpdir, 'auth')
+            with open(auth_file, 'w') as f:
+                json.dump({'login': 'bench@example.com',
+                           'api_key': 'benchmark'}, f)
+
+            with mock.patch.multiple(
+                    bugzilla._BaseSession,
+                    _auth_file=lambda _: auth_file,
+                    _validated_file=lambda _: os.path.join(tmpdir, 'valid'),
+                    _uri=lambda _, path: self.url + '/'.join(path)):
+                with bugzilla.Session(**kwargs) as session:
+                    yield session
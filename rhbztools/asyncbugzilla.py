@@ -0,0 +1,227 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import asyncio
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from rhbztools import bzql
+from rhbztools import jsondecode
+from rhbztools.bugzilla import (_BaseSession, _RateLimiter, BugzillaError,
+                                UpdateSummary)
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncSession(_BaseSession):
+    """An asyncio equivalent of bugzilla.Session, built on aiohttp.
+
+    The constructor makes no requests. Credentials are validated, if required,
+    before the first request. get_bugs and query return the same generators
+    as Session, after all their requests have completed.
+    """
+
+    def __init__(self,
+                 pool_size=_BaseSession.POOL_SIZE,
+                 retries=_BaseSession.RETRIES,
+                 backoff_factor=_BaseSession.BACKOFF_FACTOR,
+                 timeout=_BaseSession.TIMEOUT,
+                 workers=_BaseSession.WORKERS,
+                 rate_limit=_BaseSession.RATE_LIMIT,
+                 validate=True,
+                 validate_ttl=_BaseSession.VALIDATE_TTL,
+                 json_decoder=None):
+        if aiohttp is None:
+            raise ImportError('AsyncSession requires aiohttp')
+
+        super(AsyncSession, self).__init__()
+
+        auth_file = self._auth_file()
+        self.creds = self._read_auth(auth_file)
+
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.workers = workers
+        self._loads = jsondecode.decoder(json_decoder)
+
+        self._rate_limiter = None
+        if rate_limit is not None:
+            self._rate_limiter = _RateLimiter(rate_limit)
+
+        self._validate_ttl = validate_ttl
+        self._needs_validation = validate and (
+            not validate_ttl or not self._recently_validated(validate_ttl))
+
+        # Created on first use, as they must be created in the event loop
+        self._http = None
+        self._semaphore = None
+        self._validation = None
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _session(self):
+        if self._http is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            self._http = aiohttp.ClientSession(connector=connector,
+                                               timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._http
+
+    async def _request(self, method, path, params=None, body=None):
+        http = self._session()
+
+        kwargs = {'params': self._params(params)}
+        if body is not None:
+            kwargs['json'] = body
+
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                await asyncio.sleep(self._rate_limiter.delay())
+
+            try:
+                async with self._semaphore:
+                    async with http.request(method, self._uri(path),
+                                            **kwargs) as resp:
+                        if (resp.status not in self.RETRY_STATUS or
+                                attempt >= self.retries):
+                            return await resp.json(content_type=None,
+                                                   loads=self._loads)
+            except aiohttp.ClientConnectionError:
+                if attempt >= self.retries:
+                    raise
+
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def _validate_creds(self):
+        self._check_valid_login(await self._request('GET', ['valid_login']))
+        if self._validate_ttl:
+            self._remember_validation()
+
+    async def _method(self, method, path, params=None, body=None):
+        if self._needs_validation:
+            # Concurrent first requests share a single validation
+            if self._validation is None:
+                self._validation = asyncio.ensure_future(
+                    self._validate_creds())
+            await self._validation
+
+        resp = await self._request(method, path, params=params, body=body)
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug('Response: {resp}'.format(resp=resp))
+
+        self._check_auth(resp)
+        return resp
+
+    async def _get(self, path, params=None):
+        return await self._method('GET', path, params=params)
+
+    async def _put(self, path, body, params=None):
+        return await self._method('PUT', path, params=params, body=body)
+
+    @staticmethod
+    def _chain(buglists):
+        return (bug for buglist in buglists for bug in buglist)
+
+    async def get_bug(self, bzid, fields=None):
+        return await self.get_bugs([bzid], fields=fields)
+
+    async def get_bugs(self, bzids, fields=None):
+        include_fields = self._include_fields(fields)
+
+        async def _fetch(chunk):
+            params = {'id': ','.join(chunk)}
+            if include_fields is not None:
+                params['include_fields'] = include_fields
+            return await self._get(['bug'], params)
+
+        chunks = self._id_chunks(bzids, self.MAX_ID_LENGTH)
+        responses = await asyncio.gather(*(_fetch(chunk) for chunk in chunks))
+        return self._chain([self._buglist(response, fields)
+                            for response in responses])
+
+    async def query(self, query, fields=None,
+                    page_size=_BaseSession.PAGE_SIZE):
+        params = bzql.translate(query)
+
+        include_fields = self._include_fields(fields)
+        if include_fields is not None:
+            params = dict(params, include_fields=include_fields)
+
+        # A page_size of None fetches all results in a single request
+        if page_size is None:
+            response = await self._get(['bug'], params)
+            return self._buglist(response, fields)
+
+        buglists = []
+        (offset, full) = (0, 0)
+        while True:
+            # Order by bug id so that pages don't overlap
+            page_params = dict(params, limit=page_size, offset=offset,
+                               order='bug_id')
+            response = await self._get(['bug'], page_params)
+            buglists.append(self._buglist(response, fields))
+
+            # See Session._paged_buglist: bugzilla may cap limit, so a page
+            # smaller than page_size isn't necessarily the last
+            count = len(response.get('bugs'))
+            if count == 0 or count < full:
+                return self._chain(buglists)
+            full = max(full, count)
+            offset += count
+
+    async def update_bug(self, bzid, values):
+        return await self._put(['bug', str(bzid)], body=values)
+
+    async def update_bugs(self, bzids, values):
+        # See Session.update_bugs: RH Bugzilla requires one PUT per bug
+        async def _update(bzid):
+            resp = await self.update_bug(bzid, values)
+            if isinstance(resp, dict) and resp.get('error'):
+                raise BugzillaError(resp.get('message'))
+            return resp
+
+        bzids = list(bzids)
+        results = await asyncio.gather(*(_update(bzid) for bzid in bzids),
+                                       return_exceptions=True)
+
+        summary = UpdateSummary()
+        for (bzid, result) in zip(bzids, results):
+            if isinstance(result, BaseException):
+                LOG.debug('Failed to update bug {bzid}: {msg}'.format(
+                            bzid=bzid, msg=str(result)))
+                summary.failed[bzid] = result
+            else:
+                summary.updated[bzid] = result
+
+        return summary
@@ -0,0 +1,239 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import appdirs
+import json
+import logging
+import os
+import os.path
+import sqlite3
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# SQLite's default limit on the number of host parameters in a statement is 999
+_BATCH_SIZE = 500
+
+
+class _SQLiteCache:
+    # Subclasses define the file name and schema of their cache
+    FILENAME = None
+    TABLE = None
+    SCHEMA = None
+
+    @classmethod
+    def default_path(cls):
+        return os.path.join(appdirs.user_cache_dir('rhbugzilla'),
+                            cls.FILENAME)
+
+    def __init__(self, path=None):
+        super(_SQLiteCache, self).__init__()
+
+        if path is None:
+            path = self.default_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(self.SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM {table}'.format(table=self.TABLE))
+
+
+class BugCache(_SQLiteCache):
+    """An on-disk cache of bug records, keyed by bug id.
+
+    Each record is stored with its last_change_time and the list of fields it
+    was fetched with. A record fetched without a list of fields has bugzilla's
+    default fields, which is stored as ['_default'].
+    """
+
+    FILENAME = 'bugs.sqlite'
+    TABLE = 'bugs'
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS bugs (
+            id INTEGER PRIMARY KEY,
+            last_change_time TEXT NOT NULL,
+            fields TEXT,
+            data TEXT NOT NULL
+        )
+    '''
+
+    # The fields of a record fetched without a list of fields
+    DEFAULT_FIELDS = ['_default']
+
+    @classmethod
+    def _fields(cls, fields):
+        # Older records fetched with default fields were stored with None
+        return cls.DEFAULT_FIELDS if fields is None else fields
+
+    @classmethod
+    def _covers(cls, cached_fields, fields, bug):
+        cached_fields = cls._fields(cached_fields)
+        if '_all' in cached_fields:
+            return True
+
+        # We don't know exactly which fields a set of fields such as _default
+        # contains, but any field in the record was fetched
+        missing = set(cls._fields(fields)) - set(cached_fields)
+        return all(field in bug for field in missing)
+
+    def _select(self, bzids):
+        bzids = list(bzids)
+        for i in range(0, len(bzids), _BATCH_SIZE):
+            batch = bzids[i:i + _BATCH_SIZE]
+            sql = ('SELECT id, last_change_time, fields, data FROM bugs '
+                   'WHERE id IN ({params})'.format(
+                       params=','.join('?' * len(batch))))
+            yield from self._db.execute(sql, batch)
+
+    def get(self, bzids, fields=None):
+        """Return a dict of cached bugs by id.
+
+        Only bugs whose cached record contains at least the given fields are
+        returned. A fields value of None requires a record with bugzilla's
+        default fields.
+        """
+        found = {}
+        with self._lock:
+            rows = list(self._select(int(bzid) for bzid in bzids))
+
+        for (bzid, _, cached_fields, data) in rows:
+            if cached_fields is not None:
+                cached_fields = json.loads(cached_fields)
+            bug = json.loads(data)
+            if self._covers(cached_fields, fields, bug):
+                found[bzid] = bug
+
+        LOG.debug('Bug cache: {hits} of {n} bugs found'.format(
+                    hits=len(found), n=len(bzids)))
+        return found
+
+    def put(self, bugs, fields=None):
+        """Store bugs fetched with the given fields.
+
+        Every bug must contain id and last_change_time. A record for the same
+        version of a bug is merged with the existing record, otherwise the
+        existing record is replaced.
+        """
+        bugs = {bug['id']: bug for bug in bugs}
+        fields = self._fields(fields)
+
+        with self._lock, self._db:
+            existing = {row[0]: row for row in self._select(bugs.keys())}
+
+            for (bzid, bug) in bugs.items():
+                record_fields = fields
+                record = bug
+
+                row = existing.get(bzid)
+                if row is not None and row[1] == bug['last_change_time']:
+                    cached_fields = self._fields(
+                        row[2] if row[2] is None else json.loads(row[2]))
+                    record_fields = set(fields) | set(cached_fields)
+                    record = dict(json.loads(row[3]), **bug)
+
+                record_fields = json.dumps(sorted(record_fields))
+
+                self._db.execute(
+                    'INSERT OR REPLACE INTO bugs '
+                    '(id, last_change_time, fields, data) '
+                    'VALUES (?, ?, ?, ?)',
+                    (bzid, bug['last_change_time'], record_fields,
+                     json.dumps(record)))
+
+
+class QueryCache(_SQLiteCache):
+    """A cache of query results, keyed by the query's request parameters.
+
+    Results expire ttl seconds after they were stored. When there are more
+    than max_entries results, the least recently used are evicted. A path of
+    ':memory:' gives a cache which lasts only as long as the process.
+    """
+
+    FILENAME = 'queries.sqlite'
+    TABLE = 'queries'
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS queries (
+            key TEXT PRIMARY KEY,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            data TEXT NOT NULL
+        )
+    '''
+
+    TTL = 15 * 60
+    MAX_ENTRIES = 100
+
+    def __init__(self, path=None, ttl=TTL, max_entries=MAX_ENTRIES):
+        super(QueryCache, self).__init__(path)
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(params):
+        return json.dumps(params, sort_keys=True)
+
+    def get(self, params):
+        """Return the cached list of bugs for params, or None"""
+        key = self.key(params)
+        now = time.time()
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM queries WHERE created <= ?',
+                             (now - self.ttl,))
+            row = self._db.execute('SELECT data FROM queries WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                LOG.debug('Query cache miss')
+                return None
+
+            self._db.execute('UPDATE queries SET accessed = ? WHERE key = ?',
+                             (now, key))
+
+        LOG.debug('Query cache hit')
+        return json.loads(row[0])
+
+    def put(self, params, bugs):
+        now = time.time()
+
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO queries '
+                '(key, created, accessed, data) VALUES (?, ?, ?, ?)',
+                (self.key(params), now, now, json.dumps(bugs)))
+
+            # Evict the least recently used results
+            self._db.execute(
+                'DELETE FROM queries WHERE key NOT IN ('
+                'SELECT key FROM queries ORDER BY accessed DESC LIMIT ?)',
+                (self.max_entries,))
@@ -16,13 +16,24 @@
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
 import appdirs
+from concurrent import futures
 import dataclasses
+import hashlib
+import itertools
 import json
 import logging
 import os.path
 import requests
+import requests.adapters
+import threading
+import time
+from urllib3.util.retry import Retry
 
 from rhbztools import bzql
+from rhbztools import bzqlplan
+from rhbztools import jsondecode
+from rhbztools import records
+from rhbztools import stats
 
 LOG = logging.getLogger(__name__)
 
@@ -40,10 +51,107 @@ class _Credentials:
     login: str
     api_key: str
 
-class Session:
+@dataclasses.dataclass
+class UpdateSummary:
+    # Map of bug id to the server's response for each successful update
+    updated: dict = dataclasses.field(default_factory=dict)
+    # Map of bug id to the exception raised for each failed update
+    failed: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+# Bugzilla's shortcuts for sets of fields, which may be given in fields
+# alongside individual field names
+FIELD_SETS = ('_all', '_default', '_extra', '_custom')
+
+# Fields which are generated locally rather than fetched from bugzilla
+PSEUDO_FIELDS = ('bzurl',)
+
+def required_fields(*consumers):
+    """Return the fields to fetch for bugs which are read by consumers.
+
+    Each consumer is a list of the fields it reads, an object with a fields
+    attribute like bzqleval.Predicate, or None if it reads every field.
+    Returns None if any consumer reads every field, and otherwise the union of
+    the fields read in the order they were first given.
+    """
+    fields = []
+    for consumer in consumers:
+        consumer = getattr(consumer, 'fields', consumer)
+        if consumer is None:
+            return None
+        for field in consumer:
+            if field not in fields:
+                fields.append(field)
+
+    # _all already includes every other field
+    if '_all' in fields:
+        return ['_all']
+    return fields
+
+class _RateLimiter:
+    """Space calls at least 1/rate seconds apart across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def delay(self):
+        """Reserve the next slot, and return the seconds until it starts"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+
+        return start - now
+
+    def wait(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+class _BaseSession:
+    # Defaults for the pooled HTTP transport
+    POOL_SIZE = 10
+    RETRIES = 3
+    BACKOFF_FACTOR = 0.5
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    TIMEOUT = 60
+
+    # Defaults for concurrent updates
+    WORKERS = 4
+    RATE_LIMIT = None
+
+    # Seconds for which a successful credential validation is remembered
+    VALIDATE_TTL = 24 * 60 * 60
+
+    # Bugzilla error codes which indicate missing or invalid credentials
+    AUTH_ERROR_CODES = (300, 301, 305, 306, 307, 410)
+
+    # Default number of bugs fetched per request by query
+    PAGE_SIZE = 1000
+
+    # Bytes read at a time from a streamed response
+    STREAM_CHUNK_SIZE = 65536
+
+    # Maximum length of the url encoded id parameter in a single get_bugs
+    # request, well within common server and proxy url length limits
+    MAX_ID_LENGTH = 4000
+
     def _auth_file(self):
         return os.path.join(appdirs.user_config_dir('rhbugzilla'), 'auth')
 
+    def _validated_file(self):
+        # Don't store the api key, even in the cache directory
+        digest = hashlib.sha256('{login}:{api_key}'.format(
+                    **dataclasses.asdict(self.creds)).encode('utf-8'))
+        return os.path.join(appdirs.user_cache_dir('rhbugzilla'),
+                            'valid_login-{digest}'.format(
+                                digest=digest.hexdigest()[:16]))
+
     @staticmethod
     def _read_auth(auth_file):
         try:
@@ -62,45 +170,50 @@ class Session:
                    '{path}'.format(path=auth_file))
             raise AuthError(msg)
 
-    def _method(self, func, path, params=None, body=None):
-        if params is None:
-            params = {}
-        params.update(dataclasses.asdict(self.creds))
-
-        uri = 'https://bugzilla.redhat.com/rest/' + '/'.join(path)
-        kwargs = {'params': params}
-        if body is not None:
-            kwargs['json'] = body
-
-        resp = func(uri, **kwargs).json()
-        LOG.debug('Response: {resp}'.format(resp=resp))
-        return resp
+    def _uri(self, path):
+        return 'https://bugzilla.redhat.com/rest/' + '/'.join(path)
 
-    def _get(self, path, params=None):
-        return self._method(requests.get, path,
-                            params=params)
-
-    def _put(self, path, body, params=None):
-        return self._method(requests.put, path,
-                            params=params, body=body)
+    def _params(self, params):
+        params = {} if params is None else dict(params)
+        params.update(dataclasses.asdict(self.creds))
+        return params
 
-    def _validate_creds(self):
-        resp = self._get(['valid_login'])
+    def _check_auth(self, resp):
+        if (isinstance(resp, dict) and resp.get('error') and
+                resp.get('code') in self.AUTH_ERROR_CODES):
+            self._forget_validation()
+            raise AuthRequired(resp.get('message'))
 
+    @staticmethod
+    def _check_valid_login(resp):
         if resp.get('error'):
             raise AuthRequired(resp.get('message'))
 
         if not resp.get('result'):
             raise AuthRequired('Invalid login details')
 
-    def __init__(self):
-        auth_file = self._auth_file()
-
-        self.creds = self._read_auth(auth_file)
-        self._validate_creds()
+    def _recently_validated(self, ttl):
+        try:
+            validated = os.path.getmtime(self._validated_file())
+        except OSError:
+            return False
+        return 0 <= time.time() - validated < ttl
 
-    def get_bug(self, bzid, fields=None):
-        return self.get_bugs([bzid], fields=fields)
+    def _remember_validation(self):
+        path = self._validated_file()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+            os.utime(path)
+        except OSError as ex:
+            LOG.debug('Unable to record credential validation: {msg}'.format(
+                        msg=str(ex)))
+
+    def _forget_validation(self):
+        try:
+            os.unlink(self._validated_file())
+        except OSError:
+            pass
 
     @staticmethod
     def _buglist(response, fields):
@@ -121,32 +234,498 @@ class Session:
     @staticmethod
     def _include_fields(fields):
         if fields is not None:
+            fields = [field for field in fields
+                      if field not in PSEUDO_FIELDS]
             if 'id' not in fields:
                 fields = fields + ['id']
             return ','.join(fields)
 
-    def get_bugs(self, bzids, fields=None):
-        params = {'id': ','.join((str(bzid) for bzid in bzids))}
-        params.update(dataclasses.asdict(self.creds))
+    @staticmethod
+    def _id_chunks(bzids, max_length):
+        # Each id after the first is preceded by a url encoded comma
+        sep_length = len('%2C')
 
-        include_fields = self._include_fields(fields)
-        if include_fields is not None:
-            params['include_fields'] = include_fields
+        chunk = []
+        length = 0
+        for bzid in bzids:
+            bzid = str(bzid)
+            bzid_length = len(bzid) + (sep_length if chunk else 0)
+            if chunk and length + bzid_length > max_length:
+                yield chunk
+                chunk = []
+                length = 0
+                bzid_length = len(bzid)
+
+            chunk.append(bzid)
+            length += bzid_length
+
+        if chunk:
+            yield chunk
+
+
+class Session(_BaseSession):
+    @classmethod
+    def _http_session(cls, pool_size, retries, backoff_factor):
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=cls.RETRY_STATUS,
+                      raise_on_status=False)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=pool_size,
+                                                max_retries=retry)
+
+        http = requests.Session()
+        http.mount('https://', adapter)
+        return http
+
+    def _request(self, method, path, params=None, body=None, stream=False):
+        kwargs = {'params': self._params(params), 'timeout': self.timeout,
+                  'stream': stream}
+        if body is not None:
+            kwargs['json'] = body
 
-        response = self._get(['bug'], params)
-        return self._buglist(response, fields)
+        if self._rate_limiter is not None:
+            self._rate_limiter.wait()
 
-    def query(self, query, fields=None):
-        parser = bzql.parser()
-        params = parser(query)
+        return self.http.request(method, self._uri(path), **kwargs)
 
+    def _method(self, method, path, params=None, body=None):
+        start = time.perf_counter()
+        # Stream the body so that we can time downloading it separately
+        response = self._request(method, path, params, body, stream=True)
+        received = time.perf_counter()
+        content = response.content
+        downloaded = time.perf_counter()
+        resp = self._loads(content)
+
+        if self.hooks:
+            now = time.perf_counter()
+            self._report(method, path, response, len(content),
+                         download=downloaded - received,
+                         decode=now - downloaded, total=now - start)
+
+        # Formatting a large response is expensive, so only do it if it will
+        # be logged
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug('Response: {resp}'.format(resp=resp))
+
+        self._check_auth(resp)
+        return resp
+
+    def _report(self, method, path, response, size, download, decode,
+                total):
+        retries = getattr(response.raw, 'retries', None)
+        request_stats = stats.RequestStats(
+            method=method, endpoint=stats.endpoint(path),
+            status=response.status_code, size=size,
+            retries=len(retries.history) if retries is not None else 0,
+            ttfb=response.elapsed.total_seconds(),
+            download=download, decode=decode, total=total)
+        for hook in self.hooks:
+            hook(request_stats)
+
+    def _stream_buglist(self, params, fields):
+        # Decode bugs from the response as it is received
+        start = time.perf_counter()
+        response = self._request('GET', ['bug'], params, stream=True)
+        received = time.perf_counter()
+        size = 0
+
+        def _chunks():
+            nonlocal size
+            for chunk in response.iter_content(self.STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                yield chunk
+
+        def _done():
+            response.close()
+            if self.hooks:
+                now = time.perf_counter()
+                self._report('GET', ['bug'], response, size,
+                             download=now - received, decode=0.0,
+                             total=now - start)
+
+        (bugs, document) = jsondecode.iter_array(_chunks(), 'bugs')
+
+        # The response has no bugs, e.g. because it is an error
+        if bugs is None:
+            _done()
+            self._check_auth(document)
+            return self._buglist(document, fields)
+
+        def _bugs():
+            try:
+                yield from bugs
+            finally:
+                _done()
+
+        return self._buglist({'bugs': _bugs()}, fields)
+
+    def _get(self, path, params=None):
+        return self._method('GET', path,
+                            params=params)
+
+    def _put(self, path, body, params=None):
+        return self._method('PUT', path,
+                            params=params, body=body)
+
+    def _validate_creds(self):
+        self._check_valid_login(self._get(['valid_login']))
+
+    def __init__(self, http=None,
+                 pool_size=_BaseSession.POOL_SIZE,
+                 retries=_BaseSession.RETRIES,
+                 backoff_factor=_BaseSession.BACKOFF_FACTOR,
+                 timeout=_BaseSession.TIMEOUT,
+                 workers=_BaseSession.WORKERS,
+                 rate_limit=_BaseSession.RATE_LIMIT,
+                 cache=None, query_cache=None, validate=True,
+                 validate_ttl=_BaseSession.VALIDATE_TTL,
+                 json_decoder=None, stream=False, hooks=None):
+        auth_file = self._auth_file()
+
+        # Callables which are passed a stats.RequestStats after each request
+        self.hooks = list(hooks) if hooks is not None else []
+
+        self.creds = self._read_auth(auth_file)
+
+        # The function used to decode responses: by default the fastest
+        # available. See jsondecode.DECODERS.
+        self._loads = jsondecode.decoder(json_decoder)
+
+        # Unpaged queries decode bugs incrementally as the response is
+        # received, rather than decoding the whole response first
+        self.stream = stream
+
+        # All REST calls share a single keep-alive connection pool. The caller
+        # may supply their own requests.Session as the transport instead.
+        if http is None:
+            http = self._http_session(pool_size, retries, backoff_factor)
+        self.http = http
+        self.timeout = timeout
+
+        # Bound concurrent requests, and optionally limit the rate of all
+        # requests to the server to rate_limit per second
+        self.workers = workers
+        self._rate_limiter = None
+        if rate_limit is not None:
+            self._rate_limiter = _RateLimiter(rate_limit)
+
+        # An optional BugCache which get_bugs and query will use to avoid
+        # refetching bugs which have not changed
+        self.cache = cache
+
+        # An optional QueryCache which query will use to return recent
+        # results without contacting the server
+        self.query_cache = query_cache
+
+        # Validating credentials costs a round trip. We skip it if the same
+        # credentials were validated within validate_ttl seconds, or entirely
+        # if validate is False. Either way, an authentication error from any
+        # later call raises AuthRequired.
+        if validate:
+            if not validate_ttl or not self._recently_validated(validate_ttl):
+                self._validate_creds()
+                if validate_ttl:
+                    self._remember_validation()
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_bug(self, bzid, fields=None):
+        return self.get_bugs([bzid], fields=fields)
+
+    def get_bugs(self, bzids, fields=None, ordered=True, compact=False):
+        """Return a generator of the given bugs.
+
+        If compact is True, bugs are returned as records.BugRecords, which use
+        much less memory than dicts when many bugs are kept.
+        """
+        if self.cache is not None:
+            bugs = self._cached_get_bugs(bzids, fields)
+        else:
+            bugs = self._get_bugs(bzids, fields, ordered=ordered)
+
+        if compact:
+            return records.compact(bugs)
+        return bugs
+
+    def _get_bugs(self, bzids, fields, params=None, ordered=True):
+        include_fields = self._include_fields(fields)
+
+        def _fetch(chunk):
+            chunk_params = {'id': ','.join(chunk)}
+            if params is not None:
+                chunk_params.update(params)
+            if include_fields is not None:
+                chunk_params['include_fields'] = include_fields
+            return self._get(['bug'], chunk_params)
+
+        chunks = list(self._id_chunks(bzids, self.MAX_ID_LENGTH))
+        if len(chunks) <= 1:
+            responses = [_fetch(chunk) for chunk in chunks]
+            return self._chained_buglist(responses, fields)
+
+        # Fetch chunks concurrently
+        executor = futures.ThreadPoolExecutor(max_workers=self.workers)
+        pending = [executor.submit(_fetch, chunk) for chunk in chunks]
+        executor.shutdown(wait=False)
+
+        def _cancel():
+            # Don't leave requests running in the background if the caller
+            # stops iterating or we raise an error
+            for f in pending:
+                f.cancel()
+            futures.wait(pending)
+
+        if ordered:
+            responses = (f.result() for f in pending)
+        else:
+            responses = (f.result() for f in futures.as_completed(pending))
+        return self._chained_buglist(responses, fields, cleanup=_cancel)
+
+    def _chained_buglist(self, responses, fields, cleanup=None):
+        # Check the first response immediately so that errors are raised by
+        # the caller rather than on iteration
+        responses = iter(responses)
+        try:
+            buglists = [self._buglist(response, fields)
+                        for response in itertools.islice(responses, 1)]
+        except Exception:
+            if cleanup is not None:
+                cleanup()
+            raise
+
+        def _chain():
+            try:
+                yield from itertools.chain.from_iterable(buglists)
+                for response in responses:
+                    yield from self._buglist(response, fields)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+
+        return _chain()
+
+    def _paged_buglist(self, params, fields, page_size, prefetch):
+        def _fetch(offset):
+            # Order by bug id so that pages don't overlap
+            page_params = dict(params, limit=page_size, offset=offset,
+                               order='bug_id')
+            return self._get(['bug'], page_params)
+
+        # Fetch the first page immediately so that errors are raised by the
+        # caller rather than on iteration
+        response = _fetch(0)
+        buglist = self._buglist(response, fields)
+
+        def _pages(response, buglist):
+            executor = None
+            if prefetch:
+                executor = futures.ThreadPoolExecutor(max_workers=1)
+
+            try:
+                (offset, full) = (0, 0)
+                while True:
+                    # Bugzilla may return fewer bugs than page_size even if
+                    # there are more, because it caps limit. A page is only
+                    # the last if it is empty, or smaller than an earlier
+                    # page.
+                    count = len(response.get('bugs'))
+                    last = count == 0 or count < full
+                    full = max(full, count)
+                    offset += count
+
+                    # Fetch the next page while the caller processes this one
+                    if not last and executor is not None:
+                        next_page = executor.submit(_fetch, offset)
+
+                    yield from buglist
+
+                    if last:
+                        return
+
+                    if executor is not None:
+                        response = next_page.result()
+                    else:
+                        response = _fetch(offset)
+                    buglist = self._buglist(response, fields)
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=False)
+
+        return _pages(response, buglist)
+
+    def query(self, query, fields=None, page_size=_BaseSession.PAGE_SIZE,
+              prefetch=False, refresh=False, plan=False, compact=False):
+        """Return a generator of bugs matching query.
+
+        If plan is True, slow predicates are evaluated locally on the results
+        of the rest of the query. See bzqlplan. If compact is True, bugs are
+        returned as records.BugRecords.
+        """
+        bugs = self._plan_query(query, fields, page_size, prefetch, refresh,
+                                plan)
+        if compact:
+            return records.compact(bugs)
+        return bugs
+
+    def _plan_query(self, query, fields, page_size, prefetch, refresh, plan):
+        if not plan:
+            return self._run_query(bzql.translate(query), fields, page_size,
+                                   prefetch, refresh)
+
+        query_plan = bzqlplan.plan(query)
+        if query_plan.predicate is None:
+            return self._run_query(query_plan.params, fields, page_size,
+                                   prefetch, refresh)
+
+        # Also fetch the fields the local predicate reads, but don't return
+        # them unless they were requested. Bugzilla's default fields may not
+        # include them.
+        fetch_fields = required_fields(
+            ['_default'] if fields is None else fields,
+            sorted(query_plan.fields))
+
+        bugs = self._run_query(query_plan.params, fetch_fields, page_size,
+                               prefetch, refresh)
+        bugs = query_plan.filter(bugs)
+        if fields is None:
+            return bugs
+        return (self._project(bug, fields) for bug in bugs)
+
+    def _run_query(self, params, fields, page_size, prefetch, refresh):
+        if self.query_cache is None:
+            return self._fetch_query(params, fields, page_size, prefetch)
+
+        # Results are cached by the request parameters. refresh bypasses the
+        # cached result, but still stores the new one.
+        key = dict(params)
+        if fields is not None:
+            key['include_fields'] = sorted(set(fields) | {'id'})
+
+        if not refresh:
+            bugs = self.query_cache.get(key)
+            if bugs is not None:
+                return (bug for bug in bugs)
+
+        bugs = list(self._fetch_query(params, fields, page_size, prefetch))
+        self.query_cache.put(key, bugs)
+        return (bug for bug in bugs)
+
+    def _fetch_query(self, params, fields, page_size, prefetch):
+        if self.cache is not None:
+            return self._cached_query(params, fields, page_size, prefetch)
+
+        return self._query(params, fields, page_size, prefetch)
+
+    def query_many(self, queries, fields=None,
+                   page_size=_BaseSession.PAGE_SIZE, refresh=False,
+                   plan=False, compact=False):
+        """Run a dict of named queries concurrently.
+
+        Returns a dict of query name to a list of bugs, in the same order as
+        queries. If any query fails, the error of the first failed query is
+        raised.
+        """
+        def _run(query):
+            return list(self.query(query, fields, page_size=page_size,
+                                   refresh=refresh, plan=plan,
+                                   compact=compact))
+
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {name: executor.submit(_run, query)
+                       for (name, query) in queries.items()}
+            return {name: future.result()
+                    for (name, future) in pending.items()}
+
+    def _query(self, params, fields, page_size, prefetch):
         include_fields = self._include_fields(fields)
         if include_fields is not None:
-            params['include_fields'] = include_fields
+            params = dict(params, include_fields=include_fields)
+
+        # A page_size of None fetches all results in a single request
+        if page_size is None:
+            if self.stream:
+                return self._stream_buglist(params, fields)
+            response = self._get(['bug'], params)
+            return self._buglist(response, fields)
+
+        return self._paged_buglist(params, fields, page_size, prefetch)
+
+    @staticmethod
+    def _cache_fields(fields):
+        # The fields to fetch for a cached record. We always need
+        # last_change_time to validate the record. Bugzilla returns its
+        # default fields if we don't ask for any.
+        if fields is None:
+            fields = ['_default']
+        fields = set(fields) - set(PSEUDO_FIELDS)
+        return sorted(fields | {'id', 'last_change_time'})
 
-        response = self._get(['bug'], params)
+    @staticmethod
+    def _project(bug, fields):
+        # A set of fields can't be projected, so return every field fetched
+        if fields is None or any(field in FIELD_SETS for field in fields):
+            return dict(bug)
+        return {field: bug[field] for field in fields + ['id']
+                if field in bug}
+
+    def _cached_buglist(self, versions, fields, bugs=None):
+        # versions is a list of (bug id, last_change_time) in output order.
+        # Only bugs which are not cached, or whose cached last_change_time
+        # differs, are fetched from the server.
+        cache_fields = self._cache_fields(fields)
+        if bugs is None:
+            bugs = self.cache.get([bzid for (bzid, _) in versions],
+                                  cache_fields)
+
+        stale = [bzid for (bzid, last_change_time) in versions
+                 if bzid not in bugs or
+                    bugs[bzid]['last_change_time'] != last_change_time]
+        if stale:
+            fetched = list(self._get_bugs(stale, cache_fields))
+            self.cache.put(fetched, cache_fields)
+            bugs.update((bug['id'], bug) for bug in fetched)
+
+        LOG.info('Fetched {n} of {total} bugs from bugzilla'.format(
+                    n=len(stale), total=len(versions)))
+
+        response = {'bugs': [self._project(bugs[bzid], fields)
+                             for (bzid, _) in versions if bzid in bugs]}
         return self._buglist(response, fields)
 
+    def _cached_get_bugs(self, bzids, fields):
+        bzids = [int(bzid) for bzid in bzids]
+        cached = self.cache.get(bzids, self._cache_fields(fields))
+
+        # Ask the server only for cached bugs which changed since the oldest
+        # cached copy, and then compare the individual timestamps
+        versions = {bzid: bug['last_change_time']
+                    for (bzid, bug) in cached.items()}
+        if versions:
+            since = {'last_change_time': min(versions.values())}
+            changed = self._get_bugs(versions.keys(),
+                                     ['last_change_time'], params=since)
+            for bug in changed:
+                versions[bug['id']] = bug['last_change_time']
+
+        return self._cached_buglist(
+            [(bzid, versions.get(bzid)) for bzid in bzids], fields,
+            bugs=cached)
+
+    def _cached_query(self, params, fields, page_size, prefetch):
+        # Fetch only the id and last_change_time of matching bugs
+        versions = [(bug['id'], bug['last_change_time'])
+                    for bug in self._query(params, ['last_change_time'],
+                                           page_size, prefetch)]
+        return self._cached_buglist(versions, fields)
+
     def update_bug(self, bzid, values):
         return self._put(['bug', str(bzid)], body=values)
 
@@ -161,5 +740,46 @@ class Session:
         #body.update(values)
         #return self._put(['bug'], body=body)
 
-        for bzid in bzids:
-            self.update_bug(bzid, values)
+        return self.apply_updates({bzid: values for bzid in bzids})
+
+    def apply_updates(self, updates, callback=None):
+        """Apply different updates to several bugs concurrently.
+
+        updates is a dict of bug id to the values to update. callback, if
+        given, is called with the bug id, response and exception of each
+        update as it completes, in the calling thread. If the caller is
+        interrupted, updates which have not started are cancelled.
+        Returns an UpdateSummary.
+        """
+        def _update(bzid):
+            resp = self.update_bug(bzid, updates[bzid])
+            if isinstance(resp, dict) and resp.get('error'):
+                raise BugzillaError(resp.get('message'))
+            return resp
+
+        summary = UpdateSummary()
+        executor = futures.ThreadPoolExecutor(max_workers=self.workers)
+        pending = {}
+        try:
+            for bzid in updates:
+                pending[executor.submit(_update, bzid)] = bzid
+            for future in futures.as_completed(pending):
+                bzid = pending[future]
+                (resp, error) = (None, None)
+                try:
+                    resp = summary.updated[bzid] = future.result()
+                except Exception as ex:
+                    LOG.debug('Failed to update bug {bzid}: {msg}'.format(
+                                bzid=bzid, msg=str(ex)))
+                    error = summary.failed[bzid] = ex
+
+                if callback is not None:
+                    callback(bzid, resp, error)
+        finally:
+            # Don't start updates which are still queued if we're
+            # interrupted. shutdown(cancel_futures=True) needs python 3.9.
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        return summary
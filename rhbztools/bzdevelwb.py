@@ -16,71 +16,320 @@
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
-from collections import defaultdict
+from collections import Counter
+import dataclasses
+import json
 import logging
+import sys
 
+from rhbztools.bugcache import BugCache
 from rhbztools.bugzilla import Session, AuthError, AuthRequired
-from rhbztools.keywords import Keywords, LineReader, InvalidKeyword
+from rhbztools.keywords import Keywords, InvalidKeyword
+from rhbztools.stats import Stats, FORMATS as STATS_FORMATS
 
 LOG = logging.getLogger(__name__)
 
 DEV_WHITEBOARD = 'cf_devel_whiteboard'
+LAST_CHANGE_TIME = 'last_change_time'
 
-def update_devel_whiteboard(bz, bzids, updater):
-    updates = defaultdict(list)
-    bugs = bz.get_bugs(bzids, fields=[DEV_WHITEBOARD])
-    for bug in bugs:
-        bzid = bug['id']
-        dev_whiteboard = bug[DEV_WHITEBOARD]
-        LOG.info('Bug {bzid} dev whiteboard: {wb}'.format(
-                    bzid=bzid, wb=dev_whiteboard))
-
-        updated = updater(dev_whiteboard)
-        if updated is None:
-            LOG.info('Bug {bzid} no change'.format(bzid=bzid))
+# The number of times to reread and update bugs which were changed by someone
+# else while we were updating them
+CONFLICT_RETRIES = 3
+
+# The number of bugs to update after each check for changes
+CHECK_CHUNK_SIZE = 100
+
+class ConflictError(Exception):
+    def __init__(self, bzid):
+        super(ConflictError, self).__init__(
+            'Bug {bzid} changed since it was read'.format(bzid=bzid))
+
+@dataclasses.dataclass
+class Change:
+    bzid: int
+    old: str
+    new: str
+    # The bug's last_change_time when old was read
+    last_change_time: str = None
+
+def plan_devel_whiteboard(bz, bzids, updater):
+    """Return a list of the Changes updater makes to the given bugs.
+
+    Bugs whose whiteboard would not change are omitted.
+    """
+    return _changes(_fetch(bz, bzids), updater)
+
+def _fetch(bz, bzids):
+    return list(bz.get_bugs(bzids, fields=[DEV_WHITEBOARD, LAST_CHANGE_TIME]))
+
+def _changes(bugs, updater):
+    whiteboards = [bug[DEV_WHITEBOARD] for bug in bugs]
+
+    update_all = getattr(updater, 'update_all', None)
+    if update_all is not None:
+        updated = update_all(whiteboards)
+    else:
+        updated = [updater(wb) for wb in whiteboards]
+
+    changes = []
+    for (bug, old, new) in zip(bugs, whiteboards, updated):
+        if new is None or new == old:
+            LOG.info('Bug {bzid} no change'.format(bzid=bug['id']))
             continue
+
+        LOG.info('Bug {bzid} will update from {old} to {new}'.format(
+                    bzid=bug['id'], old=old, new=new))
+        changes.append(Change(bug['id'], old, new,
+                              bug.get(LAST_CHANGE_TIME)))
+
+    return changes
+
+def check_plan(bz, changes):
+    """Compare a saved plan with the current whiteboards.
+
+    Returns a tuple of (changes still to make, bug ids already changed, bug
+    ids changed by someone else since the plan was made).
+    """
+    bugs = _fetch(bz, [change.bzid for change in changes])
+    current = {bug['id']: bug for bug in bugs}
+
+    (todo, done, conflicts) = ([], [], [])
+    for change in changes:
+        bug = current.get(change.bzid, {})
+        whiteboard = bug.get(DEV_WHITEBOARD)
+        if whiteboard == change.new:
+            done.append(change.bzid)
+        elif whiteboard == change.old:
+            # The plan still applies to the bug as it is now
+            todo.append(dataclasses.replace(
+                change, last_change_time=bug.get(LAST_CHANGE_TIME)))
         else:
-            LOG.info('Bug {bzid} will update to {wb}'.format(
-                        bzid=bzid, wb=updated))
+            conflicts.append(change.bzid)
+
+    return (todo, done, conflicts)
+
+def format_change(change):
+    """Return a one line summary of the words change removes and adds"""
+    (old, new) = (Counter(change.old.split()), Counter(change.new.split()))
+    removed = ['-' + word for word in (old - new).elements()]
+    added = ['+' + word for word in (new - old).elements()]
+
+    # Only whitespace or word order changed
+    if not removed and not added:
+        return '{bzid}: {old!r} -> {new!r}'.format(
+                    bzid=change.bzid, old=change.old, new=change.new)
+
+    return '{bzid}: {diff}'.format(bzid=change.bzid,
+                                   diff=' '.join(removed + added))
+
+def save_plan(path, changes):
+    with open(path, 'w') as f:
+        json.dump({'field': DEV_WHITEBOARD,
+                   'changes': [dataclasses.asdict(change)
+                               for change in changes]}, f, indent=2)
+
+def load_plan(path):
+    with open(path, 'r') as f:
+        plan = json.load(f)
+    return [Change(**change) for change in plan['changes']]
+
+def apply_changes(bz, changes, compare_and_set=False, updater=None):
+    """Make changes concurrently, and return a dict of failed bugs.
+
+    If compare_and_set is True, bugs are updated in chunks of CHECK_CHUNK_SIZE.
+    Before each chunk we reread the last_change_time of its bugs, and don't
+    update bugs which changed since their old value was read. If updater is
+    given, those bugs are reread and updater is applied again, otherwise they
+    fail with ConflictError.
 
-        updates[updated].append(bzid)
+    A bug which changes between the check and the update is still overwritten
+    unless bugzilla rejects the update. Each update is sent with the bug's
+    last_change_time as delta_ts, which bugzilla's mid-air collision check
+    uses, but we don't rely on the REST API honouring it.
+    """
+    if compare_and_set:
+        failed = {}
+        for i in range(0, len(changes), CHECK_CHUNK_SIZE):
+            failed.update(_apply_checked(bz, changes[i:i + CHECK_CHUNK_SIZE],
+                                         updater))
+    else:
+        failed = _apply(bz, changes, compare_and_set)
 
-    LOG.info('Updates: {updates}'.format(updates=updates))
+    for (bzid, ex) in failed.items():
+        LOG.error('Failed to update bug {bzid}: {msg}'.format(
+                    bzid=bzid, msg=str(ex)))
 
-    for (update, bzids) in updates.items():
-        LOG.info('Updating devel_whiteboard on {bzids} to {update}'.format(
-                    bzids=bzids, update=update))
+    return failed
 
-        bz.update_bugs(bzids, {DEV_WHITEBOARD: update})
+def _apply_checked(bz, changes, updater):
+    failed = {}
+    for attempt in range(CONFLICT_RETRIES + 1):
+        changed = _changed(bz, changes)
+        result = _apply(bz, [change for change in changes
+                             if change.bzid not in changed], True)
+
+        # Updates which failed because bugzilla noticed a change since the
+        # check are conflicts too
+        changed |= _changed(bz, [change for change in changes
+                                 if change.bzid in result])
+        failed.update((bzid, ex) for (bzid, ex) in result.items()
+                      if bzid not in changed)
+        if not changed:
+            break
+
+        for bzid in sorted(changed):
+            LOG.warning('Bug {bzid} changed since it was read'.format(
+                            bzid=bzid))
+        if updater is None or attempt == CONFLICT_RETRIES:
+            failed.update((bzid, ConflictError(bzid)) for bzid in changed)
+            break
+
+        changes = _changes(_fetch(bz, sorted(changed)), updater)
+
+    return failed
+
+def _apply(bz, changes, compare_and_set):
+    def _done(bzid, resp, error):
+        if error is None:
+            LOG.info('Updated bug {bzid}'.format(bzid=bzid))
+
+    if not changes:
+        return {}
+
+    updates = {}
+    for change in changes:
+        values = {DEV_WHITEBOARD: change.new}
+        if compare_and_set and change.last_change_time is not None:
+            # For bugzilla's mid-air collision check, if it does one
+            values['delta_ts'] = change.last_change_time
+        updates[change.bzid] = values
+
+    return dict(bz.apply_updates(updates, callback=_done).failed)
+
+def _changed(bz, changes):
+    # Return the ids of the bugs which changed since they were read
+    read = {change.bzid: change.last_change_time for change in changes
+            if change.last_change_time is not None}
+    if not read:
+        return set()
+
+    return {bug['id'] for bug in bz.get_bugs(read, fields=[LAST_CHANGE_TIME])
+            if bug.get(LAST_CHANGE_TIME) != read[bug['id']]}
+
+def update_devel_whiteboard(bz, bzids, updater, compare_and_set=False):
+    return apply_changes(bz, plan_devel_whiteboard(bz, bzids, updater),
+                         compare_and_set=compare_and_set, updater=updater)
 
 def main():
     parser = argparse.ArgumentParser(
         description='Update keywords in BZ Devel Whiteboard')
     parser.add_argument('-a', '--add', type=str, nargs='+')
     parser.add_argument('-r', '--remove', type=str, nargs='+')
-    parser.add_argument('-k', '--keywords', type=str, required=True)
+    parser.add_argument('-k', '--keywords', type=str)
     parser.add_argument('-d', '--debug', action='count', default=0)
-    parser.add_argument('bzids', type=int, nargs='+')
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help='Cache bugs locally and only refetch changed '
+                             'bugs')
+    parser.add_argument('-w', '--workers', type=int, default=Session.WORKERS)
+    parser.add_argument('--rate-limit', type=float,
+                        help='Maximum requests per second')
+    parser.add_argument('--stats', choices=STATS_FORMATS.keys(),
+                        help='Print request statistics to stderr on exit')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='Print the changes which would be made, and '
+                             'exit')
+    parser.add_argument('--save-plan', metavar='FILE',
+                        help='Save the changes to FILE')
+    parser.add_argument('--apply-plan', metavar='FILE',
+                        help='Make the changes saved in FILE')
+    parser.add_argument('--compare-and-set', action='store_true',
+                        help="Reread each bug's last_change_time just "
+                             "before updating it, and update bugs which "
+                             "changed since they were read again from their "
+                             "new whiteboard. Changes made in between are "
+                             "only detected if bugzilla honours delta_ts")
+    parser.add_argument('bzids', type=int, nargs='*')
     opts = parser.parse_args()
 
+    updater = None
+    if opts.apply_plan is None:
+        if opts.keywords is None:
+            parser.error('-k/--keywords is required')
+        if not opts.bzids:
+            parser.error('No bugs given')
+    elif opts.keywords is not None or opts.bzids:
+        parser.error('--apply-plan does not take keywords or bugs')
+
     if opts.debug == 1:
         logging.basicConfig(level=logging.INFO)
     if opts.debug > 1:
         logging.basicConfig(level=logging.DEBUG)
 
+    if opts.apply_plan is None:
+        try:
+            keywords = Keywords.load(opts.keywords)
+            updater = keywords.updater(opts.add, opts.remove)
+        except OSError as ex:
+            parser.error("Error reading keywords file: {msg}".format(
+                            msg=str(ex)))
+        except InvalidKeyword as ex:
+            parser.error("Invalid keyword: {word}".format(word=str(ex)))
+
+    if opts.stats is None:
+        return _run(opts, updater)
+
+    collector = Stats()
     try:
-        reader = LineReader(opts.keywords)
-        keywords = Keywords(reader)
-        updater = keywords.updater(opts.add, opts.remove)
-    except OSError as ex:
-        parser.error("Error reading keywords file: {msg}".format(msg=str(ex)))
-    except InvalidKeyword as ex:
-        parser.error("Invalid keyword: {word}".format(word=str(ex)))
+        return _run(opts, updater, hooks=[collector])
+    finally:
+        print(STATS_FORMATS[opts.stats](collector), file=sys.stderr)
+
+def _run(opts, updater, hooks=None):
+    cache = BugCache() if opts.cache else None
 
     try:
-        bz = Session()
+        bz = Session(workers=opts.workers, rate_limit=opts.rate_limit,
+                     cache=cache, hooks=hooks)
     except (AuthRequired, AuthError) as ex:
         print(ex)
         return 1
 
-    update_devel_whiteboard(bz, opts.bzids, updater)
+    if opts.apply_plan is not None:
+        try:
+            changes = load_plan(opts.apply_plan)
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            print('Error reading plan {path}: {msg}'.format(
+                    path=opts.apply_plan, msg=str(ex)))
+            return 1
+
+        # Bugs already changed by an earlier, interrupted run are skipped.
+        # Bugs which someone else changed since the plan was made are not
+        # overwritten.
+        (changes, done, conflicts) = check_plan(bz, changes)
+        if done:
+            print('Already updated {n} bugs'.format(n=len(done)))
+        if conflicts:
+            print('Skipping {n} bugs changed since the plan was made: '
+                  '{bzids}'.format(n=len(conflicts),
+                                   bzids=' '.join(str(i) for i in conflicts)))
+    else:
+        # Rerunning after an interruption only plans the bugs which were not
+        # yet updated, as the rest are already unchanged
+        changes = plan_devel_whiteboard(bz, opts.bzids, updater)
+
+    for change in changes:
+        print(format_change(change))
+    print('{n} bugs to update'.format(n=len(changes)))
+
+    if opts.save_plan is not None:
+        save_plan(opts.save_plan, changes)
+
+    if opts.dry_run:
+        return
+
+    failed = apply_changes(bz, changes, compare_and_set=opts.compare_and_set,
+                           updater=updater)
+    if failed:
+        print('Failed to update {n} bugs: {bzids}'.format(
+                n=len(failed), bzids=' '.join(str(i) for i in sorted(failed))))
+        return 1
@@ -16,11 +16,24 @@
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
 import contextlib
+import dataclasses
+import functools
+import hashlib
+import logging
+import os
 import os.path
+import re
+import time
+import types
 
 import tatsu
+import tatsu.exceptions
 from tatsu.walkers import NodeWalker
 
+from rhbztools import picklecache
+
+LOG = logging.getLogger(__name__)
+
 
 class BZQLWalker(NodeWalker):
     def __init__(self):
@@ -138,17 +151,408 @@ class BZQLWalker(NodeWalker):
     def walk_List(self, node):
         return ", ".join((i.scalar for i in node.list))
 
-def parser():
+def _read_grammar():
     ebnf_path = os.path.join(os.path.dirname(__file__), 'bzql.ebnf')
     with open(ebnf_path, 'r') as ebnf:
-        grammar = ebnf.read()
+        return ebnf.read()
+
+def _grammar_cache_path(grammar):
+    # The pickled model is only valid for the grammar and the version of tatsu
+    # which produced it
+    digest = hashlib.sha256()
+    digest.update(tatsu.__version__.encode('utf-8'))
+    digest.update(grammar.encode('utf-8'))
+
+    return picklecache.path('bzql-{digest}.pickle'.format(
+                                digest=digest.hexdigest()))
+
+@functools.lru_cache(maxsize=None)
+def _compiled_grammar():
+    grammar = _read_grammar()
+    cache_path = _grammar_cache_path(grammar)
+
+    compiled = picklecache.load(cache_path, 'grammar cache')
+    if compiled is None:
+        LOG.debug('Compiling BZQL grammar')
+        compiled = tatsu.compile(grammar, asmodel=True)
+        picklecache.store(cache_path, compiled, 'grammar cache')
+
+    return compiled
+
+class BZQLError(tatsu.exceptions.ParseError):
+    pass
+
+
+def _re(pattern):
+    return ('re', re.compile(pattern))
+
+def _tok(token):
+    return ('tok', token)
+
+# Field operators in the order the grammar tries them, each with the kind of
+# value it takes. The first operator which matches is used.
+_SCALAR, _LIST_OF_SCALAR, _LIST_OF_INT, _STRING, _NUMBER, _NONE = range(6)
+_OPS = [(matcher, kind) for (kind, matchers) in (
+    (_SCALAR, [
+        _re(r'(?i)equals'), _tok('='),
+        _re(r'(?i)notequals'), _tok('!='),
+        _re(r'(?i)substring'),
+        _re(r'(?i)casesubstring'), _tok('contains'),
+        _re(r'(?i)notsubstring'),
+        _re(r'(?i)changedfrom'),
+        _re(r'(?i)changedto'),
+        _re(r'(?i)changedby'),
+        _re(r'(?i)matches'),
+        _re(r'(?i)notmatches'),
+    ]),
+    (_LIST_OF_SCALAR, [
+        _re(r'(?i)anyexact'), _re(r'(?i)in'),
+        _re(r'(?i)anywordssubstr'),
+        _re(r'(?i)allwordssubstr'),
+        _re(r'(?i)nowordssubstr'),
+        _re(r'(?i)anywords'),
+        _re(r'(?i)allwords'),
+        _re(r'(?i)nowords'),
+    ]),
+    (_LIST_OF_INT, [
+        _re(r'(?i)listofbugs'),
+    ]),
+    (_STRING, [
+        _re(r'(?i)regexp'), _tok('~'),
+        _re(r'(?i)notregexp'), _tok('!~'),
+    ]),
+    (_NUMBER, [
+        _re(r'(?i)lessthaneq'), _tok('<='),
+        _re(r'(?i)lessthan'), _tok('<'),
+        _re(r'(?i)greaterthaneq'), _tok('>='),
+        _re(r'(?i)greaterthan'), _tok('>'),
+    ]),
+    (_STRING, [
+        _re(r'(?i)changedbefore'),
+        _re(r'(?i)changedafter'),
+    ]),
+    (_NONE, [
+        _re(r'(?i)isempty'),
+        _re(r'(?i)isnotempty'),
+    ]),
+) for matcher in matchers]
+
+
+class _FastParser:
+    """A recursive descent parser for the grammar in bzql.ebnf.
+
+    It accepts exactly the same language as the tatsu parser, including
+    tatsu's handling of whitespace and name guards, but builds a minimal tree
+    of tuples instead of a semantic model:
+
+        orgroup:   ('or', [andgroup, ...])
+        andgroup:  ('and', [negatable, ...])
+        negatable: (negate, ('op', field, op, value) | ('sub', orgroup))
+    """
+
+    WHITESPACE = re.compile(r'\s*')
+    FIELD = re.compile(r'[a-zA-Z_]+(\.[a-zA-Z_]+)?')
+    STRING = re.compile(r'[^"]+')
+    FLOAT = re.compile(r'\d+\.\d+')
+    INT = re.compile(r'\d+')
+    AND = (_re(r'(?i)and'), _tok('&'))
+    OR = (_re(r'(?i)or'), _tok('|'))
+    NOT = (_re(r'(?i)not'), _tok('!'))
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def _error(self, expected):
+        raise BZQLError('Expecting {expected} at position {pos}: {text!r}'
+                        .format(expected=expected, pos=self.pos,
+                                text=self.text[self.pos:self.pos + 20]))
+
+    def _skip(self):
+        self.pos = self.WHITESPACE.match(self.text, self.pos).end()
+
+    def _pattern(self, regex):
+        # Like tatsu, patterns do not skip leading whitespace
+        m = regex.match(self.text, self.pos)
+        if m is None:
+            return None
+        self.pos = m.end()
+        return m.group()
+
+    def _token(self, token):
+        self._skip()
+        if not self.text.startswith(token, self.pos):
+            return None
+
+        # Alphanumeric tokens may not be followed by a name character
+        end = self.pos + len(token)
+        if (token.isalnum() and end < len(self.text) and
+                self.text[end].isalnum()):
+            return None
+
+        self.pos = end
+        return token
+
+    def _choice(self, matchers):
+        self._skip()
+        for (kind, matcher) in matchers:
+            if kind == 're':
+                matched = self._pattern(matcher)
+            else:
+                matched = self._token(matcher)
+            if matched is not None:
+                return matched
+        return None
+
+    def _expect(self, token):
+        if self._token(token) is None:
+            self._error(repr(token))
+
+    def parse(self):
+        tree = self._orgroup()
+        self._skip()
+        if self.pos != len(self.text):
+            self._error('end of query')
+        return tree
+
+    def _orgroup(self):
+        andgroups = [self._andgroup()]
+        while self._choice(self.OR) is not None:
+            andgroups.append(self._andgroup())
+        return ('or', andgroups)
+
+    def _andgroup(self):
+        negatables = [self._negatable()]
+        while self._choice(self.AND) is not None:
+            negatables.append(self._negatable())
+        return ('and', negatables)
+
+    def _negatable(self):
+        negate = self._choice(self.NOT) is not None
+
+        self._skip()
+        if self.text.startswith('(', self.pos):
+            self._expect('(')
+            node = ('sub', self._orgroup())
+            self._expect(')')
+        else:
+            node = self._opexpression()
 
-    parser = tatsu.compile(grammar, asmodel=True)
+        return (negate, node)
 
-    def _parse(query):
-        model = parser.parse(query)
+    def _opexpression(self):
+        self._skip()
+        field = self._pattern(self.FIELD)
+        if field is None:
+            self._error('field name')
+
+        self._skip()
+        for (matcher, kind) in _OPS:
+            op = self._choice((matcher,))
+            if op is not None:
+                break
+        else:
+            self._error('operator')
+
+        if kind == _SCALAR:
+            value = self._scalar()[1]
+        elif kind == _LIST_OF_SCALAR:
+            value = self._list(self._scalar)
+        elif kind == _LIST_OF_INT:
+            value = self._list(self._int)
+        elif kind == _STRING:
+            value = self._string()[1]
+        elif kind == _NUMBER:
+            value = self._number()[1]
+        else:
+            value = None
+
+        return ('op', field, op, value)
+
+    # Values are returned as a tuple of (source text, translated value)
+
+    def _string(self):
+        self._expect('"')
+        scalar = self._pattern(self.STRING)
+        if scalar is None:
+            self._error('string')
+        self._expect('"')
+        return (scalar, scalar)
+
+    def _int(self):
+        self._skip()
+        scalar = self._pattern(self.INT)
+        if scalar is None:
+            self._error('integer')
+        return (scalar, int(scalar))
+
+    def _number(self):
+        self._skip()
+        scalar = self._pattern(self.FLOAT)
+        if scalar is not None:
+            return (scalar, float(scalar))
+        return self._int()
+
+    def _scalar(self):
+        self._skip()
+        if self.text.startswith('"', self.pos):
+            return self._string()
+        return self._number()
+
+    def _list(self, item):
+        self._expect('[')
+        items = [item()[0]]
+        while self._token(',') is not None:
+            items.append(item()[0])
+        self._expect(']')
+        return ', '.join(items)
+
+
+class _FastWalker(BZQLWalker):
+    """Generate Bugzilla search parameters from a _FastParser tree.
+
+    This mirrors BZQLWalker's handling of the tatsu model exactly.
+    """
+
+    def walk_tree(self, node, parent_is_or=False, negate=False):
+        kind = node[0]
+        if kind == 'or':
+            self._walk_or(node[1])
+        elif kind == 'and':
+            self._walk_and(node[1], parent_is_or)
+        elif kind == 'sub':
+            with self._subgroup(negate):
+                self.walk_tree(node[1])
+        else:
+            self._walk_op(node, negate)
+
+    def _walk_or(self, andgroups):
+        # Ignore or group with a single member
+        if len(andgroups) == 1:
+            return self.walk_tree(andgroups[0])
+
+        self._set('j', 'OR', n=self.n - 1)
+        for andgroup in andgroups:
+            self.walk_tree(andgroup, parent_is_or=True)
+
+    def _walk_and(self, negatables, parent_is_or):
+        def _andgroup():
+            for (negate, node) in negatables:
+                self.walk_tree(node, negate=negate)
+
+        # Populated and group beneath an or group needs an implicit subgroup
+        if parent_is_or and len(negatables) > 1:
+            with self._subgroup():
+                _andgroup()
+        else:
+            _andgroup()
+
+    def _walk_op(self, node, negate):
+        (_, field, op, value) = node
+
+        self._set('f', self.aliased_query_fields.get(field, field))
+        self._set('o', self.aliased_ops.get(op, op))
+        if negate:
+            self._set('n', 1)
+
+        if value is not None:
+            self._set('v', value)
+
+        self.n += 1
+
+
+def parse(query):
+    """Parse a query into the tree of tuples described in _FastParser"""
+    return _FastParser(query).parse()
+
+@dataclasses.dataclass
+class ParseStats:
+    query: str
+    # Seconds parsing the query, and generating search parameters
+    parse: float
+    walk: float
+
+# Callables which are passed a ParseStats each time a query is parsed. Note
+# that translate only parses queries which are not already cached.
+hooks = []
+
+def _timed(query, parse, walk):
+    # Run parse and walk, reporting their timings to hooks
+    if not hooks:
+        return walk(parse(query))
+
+    start = time.perf_counter()
+    tree = parse(query)
+    parsed = time.perf_counter()
+    params = walk(tree)
+    stats = ParseStats(query, parsed - start, time.perf_counter() - parsed)
+
+    for hook in hooks:
+        hook(stats)
+    return params
+
+def _fast_walk(tree):
+    walker = _FastWalker()
+    walker.walk_tree(tree)
+    return walker.params
+
+def _fast_parse(query):
+    return _timed(query, parse, _fast_walk)
+
+def _tatsu_parser():
+    # The compiled grammar is built at most once per process, and is
+    # persisted in the user's cache directory between processes
+    parser = _compiled_grammar()
+
+    def _walk(model):
         walker = BZQLWalker()
         walker.walk(model)
         return walker.params
 
+    def _parse(query):
+        return _timed(query, parser.parse, _walk)
+
     return _parse
+
+def parser(backend='fast'):
+    """Return a function which translates a query to search parameters.
+
+    The default 'fast' backend is a hand-written parser. The 'tatsu' backend
+    parses with the grammar in bzql.ebnf. Both produce identical parameters,
+    and raise tatsu.exceptions.ParseError for an invalid query.
+    """
+    if backend == 'fast':
+        return _fast_parse
+    if backend == 'tatsu':
+        return _tatsu_parser()
+    raise ValueError('Unknown BZQL parser backend: {backend}'.format(
+                        backend=backend))
+
+
+# Maximum number of distinct queries whose translation is memoized by translate
+TRANSLATION_CACHE_SIZE = 256
+
+# String literals, whose whitespace is significant
+_STRING_RE = re.compile(r'("[^"]*")')
+
+def _normalize(query):
+    # Collapse runs of whitespace outside string literals, which never changes
+    # the meaning of a query
+    parts = _STRING_RE.split(query)
+    parts[::2] = (' '.join(part.split()) for part in parts[::2])
+    return ''.join(parts).strip()
+
+@functools.lru_cache(maxsize=TRANSLATION_CACHE_SIZE)
+def _translate(query):
+    return types.MappingProxyType(parser()(query))
+
+def translate(query):
+    """Translate a query to Bugzilla search parameters.
+
+    Translations are memoized, so the returned mapping is read only. Callers
+    which need to modify it must take a copy.
+    """
+    return _translate(_normalize(query))
+
+translate.cache_info = _translate.cache_info
+translate.cache_clear = _translate.cache_clear
@@ -0,0 +1,278 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Evaluate BZQL queries locally against bug records.
+
+Bug records are the dicts returned by the REST API, e.g. by Session.get_bugs.
+String comparisons follow Bugzilla: equals, anyexact and casesubstring are
+case sensitive, while substring, regexp and the word operators are not.
+"""
+
+import re
+
+from rhbztools import bzql
+
+
+class UnsupportedQuery(Exception):
+    """The query cannot be evaluated locally"""
+    pass
+
+
+class MissingField(UnsupportedQuery):
+    """A bug record does not contain a field required by the query"""
+    pass
+
+
+def _flag_names(flags):
+    # Flags are matched as name and status, e.g. 'rhos-17.0+'
+    return [flag['name'] + flag['status'] for flag in flags]
+
+# Search field names whose bug record field has a different name, or whose
+# value must be transformed
+BUG_FIELDS = {
+    'blocked': ('blocks', None),
+    'bug_file_loc': ('url', None),
+    'bug_id': ('id', None),
+    'bug_severity': ('severity', None),
+    'bug_status': ('status', None),
+    'creation_ts': ('creation_time', None),
+    'delta_ts': ('last_change_time', None),
+    'dependson': ('depends_on', None),
+    'flagtypes.name': ('flags', _flag_names),
+    'rep_platform': ('platform', None),
+    'reporter': ('creator', None),
+    'short_desc': ('summary', None),
+    'status_whiteboard': ('whiteboard', None),
+}
+
+# Search fields which are not part of a bug record
+UNSUPPORTED_FIELDS = (
+    'attach_data.', 'attachments.', 'comment_tag', 'commenter', 'content',
+    'days_elapsed', 'last_visit_ts', 'longdesc', 'owner_idle_time',
+    'requestees.', 'setters.', 'tag',
+)
+
+# Operators which depend on bug history or full text search
+UNSUPPORTED_OPS = (
+    'changedafter', 'changedbefore', 'changedby', 'changedfrom', 'changedto',
+    'matches', 'notmatches',
+)
+
+_WORDS_RE = re.compile(r'[\s,]+')
+
+
+def _words(value):
+    return [word for word in _WORDS_RE.split(str(value)) if word]
+
+def _anyexact_values(value):
+    return [item.strip() for item in str(value).split(',')]
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _compare(cmp):
+    # Compare numerically if both sides are numbers, otherwise as strings.
+    # Bugzilla timestamps compare correctly as strings.
+    def _test(values, value):
+        for v in values:
+            (a, b) = (_number(v), _number(value))
+            if a is None or b is None:
+                (a, b) = (str(v), str(value))
+            if cmp(a, b):
+                return True
+        return False
+    return _test
+
+def _word_re(word):
+    return re.compile(r'(?<!\w){word}(?!\w)'.format(word=re.escape(word)),
+                      re.IGNORECASE)
+
+def _equals(values, value):
+    return any(str(v) == str(value) for v in values)
+
+def _anyexact(values, value):
+    items = set(_anyexact_values(value))
+    return any(str(v) in items for v in values)
+
+def _substring(values, value):
+    value = str(value).lower()
+    return any(value in str(v).lower() for v in values)
+
+def _casesubstring(values, value):
+    return any(str(value) in str(v) for v in values)
+
+def _regexp(values, value):
+    regexp = re.compile(str(value), re.IGNORECASE)
+    return any(regexp.search(str(v)) for v in values)
+
+def _anywordssubstr(values, value):
+    return any(_substring(values, word) for word in _words(value))
+
+def _allwordssubstr(values, value):
+    return all(_substring(values, word) for word in _words(value))
+
+def _anywords(values, value):
+    regexps = [_word_re(word) for word in _words(value)]
+    return any(r.search(str(v)) for r in regexps for v in values)
+
+def _allwords(values, value):
+    regexps = [_word_re(word) for word in _words(value)]
+    return all(any(r.search(str(v)) for v in values) for r in regexps)
+
+def _isempty(values, value):
+    return all(v is None or v == '' for v in values)
+
+def _listofbugs(values, value):
+    bzids = {int(bzid) for bzid in _words(value)}
+    return any(_number(v) in bzids for v in values)
+
+def _not(test):
+    return lambda values, value: not test(values, value)
+
+OPS = {
+    'equals': _equals,
+    'notequals': _not(_equals),
+    'anyexact': _anyexact,
+    'substring': _substring,
+    'casesubstring': _casesubstring,
+    'notsubstring': _not(_substring),
+    'regexp': _regexp,
+    'notregexp': _not(_regexp),
+    'lessthan': _compare(lambda a, b: a < b),
+    'lessthaneq': _compare(lambda a, b: a <= b),
+    'greaterthan': _compare(lambda a, b: a > b),
+    'greaterthaneq': _compare(lambda a, b: a >= b),
+    'anywordssubstr': _anywordssubstr,
+    'allwordssubstr': _allwordssubstr,
+    'nowordssubstr': _not(_anywordssubstr),
+    'anywords': _anywords,
+    'allwords': _allwords,
+    'nowords': _not(_anywords),
+    'isempty': _isempty,
+    'isnotempty': _not(_isempty),
+    'listofbugs': _listofbugs,
+}
+
+
+class Predicate:
+    """A compiled query which tests whether a bug record matches it.
+
+    fields is the set of bug record fields the query reads.
+    """
+
+    def __init__(self, query, test, fields):
+        super(Predicate, self).__init__()
+
+        self.query = query
+        self.fields = frozenset(fields)
+        self._test = test
+
+    def __call__(self, bug):
+        return self._test(bug)
+
+    def filter(self, bugs):
+        return (bug for bug in bugs if self._test(bug))
+
+
+class _Compiler:
+    def __init__(self):
+        # Use the same aliases as translation to search parameters
+        walker = bzql.BZQLWalker()
+        self.aliased_ops = walker.aliased_ops
+        self.aliased_query_fields = walker.aliased_query_fields
+
+        self.fields = set()
+
+    def compile(self, node, negate=False):
+        kind = node[0]
+        if kind == 'or':
+            tests = [self.compile(andgroup) for andgroup in node[1]]
+            test = lambda bug: any(t(bug) for t in tests)
+        elif kind == 'and':
+            tests = [self.compile(n, negate=neg) for (neg, n) in node[1]]
+            test = lambda bug: all(t(bug) for t in tests)
+        elif kind == 'sub':
+            test = self.compile(node[1])
+        else:
+            test = self._compile_op(*node[1:])
+
+        if negate:
+            return lambda bug: not test(bug)
+        return test
+
+    def _compile_op(self, field, op, value):
+        field = self.aliased_query_fields.get(field, field)
+        op = self.aliased_ops.get(op, op)
+
+        if op in UNSUPPORTED_OPS or op not in OPS:
+            raise UnsupportedQuery('Operator {op} cannot be evaluated '
+                                   'locally'.format(op=op))
+        if field.startswith(UNSUPPORTED_FIELDS):
+            raise UnsupportedQuery('Field {field} cannot be evaluated '
+                                   'locally'.format(field=field))
+
+        (key, transform) = BUG_FIELDS.get(field, (field, None))
+        self.fields.add(key)
+        op_test = OPS[op]
+
+        def _test(bug):
+            try:
+                values = bug[key]
+            except KeyError:
+                raise MissingField(key)
+
+            if transform is not None:
+                values = transform(values)
+            if not isinstance(values, list):
+                values = [values]
+
+            return op_test(values, value)
+
+        return _test
+
+
+def compile_tree(tree, query=None):
+    """Compile a tree returned by bzql.parse to a Predicate"""
+    compiler = _Compiler()
+    test = compiler.compile(tree)
+    return Predicate(query, test, compiler.fields)
+
+def compile_query(query):
+    """Compile a query to a Predicate.
+
+    Raises UnsupportedQuery if the query uses a field or operator which cannot
+    be evaluated locally.
+    """
+    return compile_tree(bzql.parse(query), query)
+
+def filter_bugs(query, bugs, session=None):
+    """Return the bugs which match query.
+
+    If the query cannot be evaluated locally and a session is given, the query
+    is run on the server instead, and the local bugs it returned are kept.
+    """
+    bugs = list(bugs)
+    try:
+        return list(compile_query(query).filter(bugs))
+    except UnsupportedQuery:
+        if session is None:
+            raise
+
+    matched = {bug['id'] for bug in session.query(query, fields=['id'])}
+    return [bug for bug in bugs if bug['id'] in matched]
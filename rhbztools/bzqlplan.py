@@ -0,0 +1,215 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Split BZQL queries between the server and the client.
+
+Some predicates, like regular expressions and text searches on long text
+fields, are slow for Bugzilla to evaluate, but are cheap to evaluate on the
+bugs it returns. A plan sends the remaining, selective predicates of a query
+to the server, and evaluates the slow ones locally on the results.
+
+Only the top level conjunction of a query is split. A query whose top level is
+an or group, or which has no selective predicates, runs entirely on the
+server.
+"""
+
+import functools
+import re
+import types
+
+from rhbztools import bzql
+from rhbztools import bzqleval
+
+# Operators which are slow for the server to evaluate on any field
+SLOW_OPS = ('regexp', 'notregexp')
+
+# Text search operators which are slow for the server on LONG_TEXT_FIELDS
+TEXT_OPS = (
+    'substring', 'casesubstring', 'notsubstring',
+    'anywordssubstr', 'allwordssubstr', 'nowordssubstr',
+    'anywords', 'allwords', 'nowords',
+)
+
+LONG_TEXT_FIELDS = (
+    'short_desc', 'status_whiteboard', 'bug_file_loc',
+    'cf_devel_whiteboard', 'cf_internal_whiteboard', 'cf_qa_whiteboard',
+)
+
+# Or groups nested at least this deep are slow for the server
+MAX_OR_DEPTH = 2
+
+# Operators whose value is a list
+_LIST_OPS = (
+    'anyexact', 'anywordssubstr', 'allwordssubstr', 'nowordssubstr',
+    'anywords', 'allwords', 'nowords', 'listofbugs',
+)
+
+_NUMBER = re.compile(r'\d+(\.\d+)?')
+
+_ALIASES = bzql.BZQLWalker()
+
+
+def _op_name(op):
+    return _ALIASES.aliased_ops.get(op, op)
+
+def _field_name(field):
+    return _ALIASES.aliased_query_fields.get(field, field)
+
+def _format_item(item):
+    # The tree doesn't record whether a list item was a number or a string,
+    # but they mean the same. listofbugs only accepts numbers.
+    if _NUMBER.fullmatch(item):
+        return item
+    return '"{item}"'.format(item=item)
+
+def _format_value(op, value):
+    if isinstance(value, str):
+        if _op_name(op) in _LIST_OPS:
+            return '[{items}]'.format(items=', '.join(
+                _format_item(item.strip()) for item in value.split(',')))
+        return '"{value}"'.format(value=value)
+    return str(value)
+
+def format_tree(node, negate=False):
+    """Format a tree returned by bzql.parse as a query"""
+    kind = node[0]
+    if kind == 'or':
+        text = ' or '.join(format_tree(andgroup) for andgroup in node[1])
+    elif kind == 'and':
+        text = ' and '.join(format_tree(n, negate=neg) for (neg, n) in node[1])
+    elif kind == 'sub':
+        text = '({sub})'.format(sub=format_tree(node[1]))
+    else:
+        (_, field, op, value) = node
+        text = '{field} {op}'.format(field=field, op=op)
+        if value is not None:
+            text += ' ' + _format_value(op, value)
+
+    if negate:
+        return 'not ' + text
+    return text
+
+def _or_depth(node):
+    kind = node[0]
+    if kind == 'or':
+        depth = max(_or_depth(andgroup) for andgroup in node[1])
+        return depth + 1 if len(node[1]) > 1 else depth
+    if kind == 'and':
+        return max(_or_depth(n) for (_, n) in node[1])
+    if kind == 'sub':
+        return _or_depth(node[1])
+    return 0
+
+def _slow_reason(node):
+    # Return why node is slow for the server to evaluate, or None
+    if node[0] == 'sub':
+        if _or_depth(node) >= MAX_OR_DEPTH:
+            return 'nested or groups'
+        return None
+
+    (_, field, op, _) = node
+    (field, op) = (_field_name(field), _op_name(op))
+    if op in SLOW_OPS:
+        return op
+    if op in TEXT_OPS and field in LONG_TEXT_FIELDS:
+        return '{op} on {field}'.format(op=op, field=field)
+    return None
+
+
+class Plan:
+    """A query split into server and client parts.
+
+    params are the Bugzilla search parameters of the server part. predicate
+    is a bzqleval.Predicate of the client part, or None if the query runs
+    entirely on the server. fields are the bug fields the predicate reads.
+    """
+
+    def __init__(self, query, server, client):
+        super(Plan, self).__init__()
+
+        self.query = query
+        self.server = server
+        self.client = client
+
+        walker = bzql._FastWalker()
+        walker.walk_tree(('and', server))
+        self.params = types.MappingProxyType(walker.params)
+
+        if client:
+            self.predicate = bzqleval.compile_tree(
+                ('and', [(neg, node) for (neg, node, _) in client]))
+            self.fields = self.predicate.fields
+        else:
+            self.predicate = None
+            self.fields = frozenset()
+
+    def filter(self, bugs):
+        if self.predicate is None:
+            return bugs
+        return self.predicate.filter(bugs)
+
+    def explain(self):
+        """Return a human readable description of the plan"""
+        lines = ['Query: {query}'.format(query=self.query), 'Server:']
+        lines.extend('  {expr}'.format(expr=format_tree(node, negate=neg))
+                     for (neg, node) in self.server)
+        lines.extend('    {key}={value}'.format(key=key, value=value)
+                     for (key, value) in self.params.items())
+
+        lines.append('Client:')
+        if not self.client:
+            lines.append('  (none)')
+        for (neg, node, reason) in self.client:
+            lines.append('  {expr}  [{reason}]'.format(
+                            expr=format_tree(node, negate=neg),
+                            reason=reason))
+        if self.fields:
+            lines.append('  fields: {fields}'.format(
+                            fields=', '.join(sorted(self.fields))))
+
+        return '\n'.join(lines)
+
+
+@functools.lru_cache(maxsize=bzql.TRANSLATION_CACHE_SIZE)
+def plan(query):
+    """Return a Plan for query"""
+    tree = bzql.parse(query)
+
+    # Only a single top level and group can be split
+    andgroups = tree[1]
+    if len(andgroups) != 1:
+        return Plan(query, [(False, tree)], [])
+
+    server = []
+    client = []
+    for (negate, node) in andgroups[0][1]:
+        reason = _slow_reason(node)
+        if reason is not None:
+            try:
+                bzqleval.compile_tree(node)
+            except bzqleval.UnsupportedQuery:
+                reason = None
+
+        if reason is None:
+            server.append((negate, node))
+        else:
+            client.append((negate, node, reason))
+
+    # Without a selective server predicate the server would return every bug
+    if not server:
+        return Plan(query, [(False, tree)], [])
+
+    return Plan(query, server, client)
@@ -18,10 +18,17 @@
 import argparse
 import json
 import logging
+import sys
 import yaml
 
-from rhbztools.bugzilla import Session, AuthError, AuthRequired
+from rhbztools.bugcache import BugCache, QueryCache
+from rhbztools.bugzilla import (Session, AuthError, AuthRequired,
+                                FIELD_SETS)
 from rhbztools import bzql
+from rhbztools import bzqlplan
+from rhbztools import columnar
+from rhbztools import records
+from rhbztools.stats import Stats, FORMATS as STATS_FORMATS
 
 LOG = logging.getLogger(__name__)
 
@@ -35,14 +42,87 @@ class CommaListArg(argparse.Action):
 
         listarg.extend(values.split(','))
 
+def write_json(bugs, out):
+    # Equivalent to json.dumps(list(bugs)), but writes each bug as it is
+    # yielded rather than holding the whole result in memory
+    out.write('[')
+    for (i, bug) in enumerate(bugs):
+        if i > 0:
+            out.write(', ')
+        out.write(json.dumps(bug, default=records.to_json))
+    out.write(']\n')
+
+def write_ndjson(bugs, out):
+    for bug in bugs:
+        out.write(json.dumps(bug, default=records.to_json))
+        out.write('\n')
+
+WRITERS = {
+    'json': write_json,
+    'ndjson': write_ndjson,
+}
+
+def write_columnar(output, bugs, fields):
+    (writer, binary) = columnar.WRITERS[output]
+    writer(bugs, sys.stdout.buffer if binary else sys.stdout, fields)
+
 def main():
     parser = argparse.ArgumentParser(description='Query bugzilla')
     parser.add_argument('-f', '--field', action=CommaListArg, type=str)
     parser.add_argument('-d', '--debug', action='count', default=0)
+    parser.add_argument('-c', '--cache', action='store_true',
+                        help='Cache bugs locally and only refetch changed '
+                             'bugs')
+    parser.add_argument('--query-ttl', type=int, metavar='SECONDS',
+                        help='Reuse results of identical queries made '
+                             'within SECONDS')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Ignore cached query results')
     parser.add_argument('-q', '--queryfile')
-    parser.add_argument('query', type=str)
+    parser.add_argument('-p', '--page-size', type=int,
+                        default=Session.PAGE_SIZE,
+                        help='Number of bugs to fetch per request, or 0 to '
+                             'fetch all bugs in a single request')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='Fetch the next page of results in the '
+                             'background')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='Run all queries in the query file')
+    parser.add_argument('-o', '--output',
+                        choices=list(WRITERS) + list(columnar.WRITERS),
+                        default='json',
+                        help='Output a JSON list, one JSON bug per line, or '
+                             'a column for each field given with -f')
+    parser.add_argument('-w', '--workers', type=int, default=Session.WORKERS,
+                        help='Number of queries to run concurrently')
+    parser.add_argument('--plan', action='store_true',
+                        help='Evaluate slow predicates locally on the '
+                             'results of the rest of the query')
+    parser.add_argument('--explain', action='store_true',
+                        help='Print how each query would be split between '
+                             'the server and the client, and exit')
+    parser.add_argument('--stats', choices=STATS_FORMATS.keys(),
+                        help='Print request and query parsing statistics '
+                             'to stderr on exit')
+    parser.add_argument('query', type=str, nargs='*')
     opts = parser.parse_args()
 
+    if opts.all and opts.queryfile is None:
+        parser.error('--all requires a query file')
+    if not opts.all and not opts.query:
+        parser.error('No query given')
+
+    if opts.output in columnar.WRITERS:
+        if not opts.field:
+            parser.error('--output {output} requires fields given with '
+                         '-f'.format(output=opts.output))
+        if any(field in FIELD_SETS for field in opts.field):
+            parser.error('--output {output} does not support field '
+                         'sets'.format(output=opts.output))
+        if opts.output != 'csv' and columnar.pyarrow is None:
+            parser.error('--output {output} requires pyarrow'.format(
+                            output=opts.output))
+
     if opts.debug == 1:
         logging.basicConfig(level=logging.INFO)
     if opts.debug > 1:
@@ -55,23 +135,90 @@ def main():
                 queries = yaml.safe_load(queryfile)
         except Exception as ex:
             parser.error('Unable to read queries from {path}: {msg}'.format(
-                            path=parser.queryfile, msg=str(ex)))
+                            path=opts.queryfile, msg=str(ex)))
 
-    if opts.query in queries:
-        query = queries[opts.query]
-    else:
-        query = opts.query
+    if opts.explain:
+        names = queries.keys() if opts.all else opts.query
+        try:
+            plans = [bzqlplan.plan(queries.get(name, name)) for name in names]
+        except Exception as ex:
+            print('Error parsing query: {msg}'.format(msg=str(ex)))
+            return 1
+        print('\n\n'.join(query_plan.explain() for query_plan in plans))
+        return
+
+    if opts.stats is None:
+        return _run(opts, queries)
 
+    collector = Stats()
+    bzql.hooks.append(collector)
     try:
-        bz = Session()
+        return _run(opts, queries, hooks=[collector])
+    finally:
+        print(STATS_FORMATS[opts.stats](collector), file=sys.stderr)
+
+def _run(opts, queries, hooks=None):
+    cache = BugCache() if opts.cache else None
+
+    query_cache = None
+    if opts.query_ttl is not None:
+        query_cache = QueryCache(ttl=opts.query_ttl)
+
+    try:
+        # Bugs are written as they are decoded, so also decode unpaged
+        # results incrementally
+        bz = Session(cache=cache, query_cache=query_cache,
+                     workers=opts.workers, stream=True, hooks=hooks)
     except (AuthRequired, AuthError) as ex:
         print(ex)
         return 1
 
+    # Run multiple queries concurrently, and output results keyed by query
+    # name. All results are held in memory, so store them compactly.
+    if opts.all or len(opts.query) > 1:
+        names = queries.keys() if opts.all else opts.query
+        batch = {name: queries.get(name, name) for name in names}
+        try:
+            results = bz.query_many(batch, opts.field,
+                                    page_size=opts.page_size or None,
+                                    refresh=opts.refresh,
+                                    plan=opts.plan, compact=True)
+        except Exception as ex:
+            print('Error fetching bugs: {msg}'.format(msg=str(ex)))
+            return 1
+
+        if opts.output in columnar.WRITERS:
+            # Add a column naming the query of each bug
+            write_columnar(opts.output,
+                           (dict(bug, query=name)
+                            for (name, bugs) in results.items()
+                            for bug in bugs),
+                           ['query'] + opts.field)
+        elif opts.output == 'ndjson':
+            write_ndjson(({'query': name, 'bugs': bugs}
+                          for (name, bugs) in results.items()), sys.stdout)
+        else:
+            print(json.dumps(results, default=records.to_json))
+        return
+
+    query = queries.get(opts.query[0], opts.query[0])
+
     try:
-        response = bz.query(query, opts.field)
+        response = bz.query(query, opts.field,
+                            page_size=opts.page_size or None,
+                            prefetch=opts.prefetch,
+                            refresh=opts.refresh,
+                            plan=opts.plan)
     except Exception as ex:
         print('Error fetching bugs: {msg}'.format(msg=str(ex)))
         return 1
 
-    print(json.dumps(list(response)))
+    try:
+        if opts.output in columnar.WRITERS:
+            write_columnar(opts.output, response, opts.field)
+        else:
+            WRITERS[opts.output](response, sys.stdout)
+    except Exception as ex:
+        print('Error fetching bugs: {msg}'.format(msg=str(ex)),
+              file=sys.stderr)
+        return 1
@@ -0,0 +1,181 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Write bugs as columns of fields, for loading into analytics tools.
+
+Bugs are written as they are yielded, so a paginated query is never held in
+memory. Arrow and Parquet output hold up to INFER_BATCHES batches until the
+type of each column is known. Columns are written in the order the fields
+were given, after id. Arrow and Parquet output require pyarrow.
+"""
+
+import csv
+import json
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Number of bugs in each Arrow record batch or Parquet row group
+BATCH_SIZE = 1000
+
+# The maximum number of batches held while inferring column types
+INFER_BATCHES = 10
+
+
+def columns(fields):
+    """Return the output columns for fields"""
+    return ['id'] + [field for field in dict.fromkeys(fields)
+                     if field != 'id']
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+def write_csv(bugs, out, fields):
+    cols = columns(fields)
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(cols)
+    for bug in bugs:
+        writer.writerow([_csv_value(bug.get(col)) for col in cols])
+
+def _batches(bugs, cols, batch_size):
+    # Yield record batches of bugs with a consistent schema. Batches are held
+    # until the type of every column is known from a value which isn't null
+    # or empty, or for at most INFER_BATCHES batches.
+    schema = None
+    pending = []
+    batch = []
+    for bug in bugs:
+        batch.append({col: bug.get(col) for col in cols})
+        if len(batch) < batch_size:
+            continue
+
+        if schema is None:
+            pending.append(batch)
+            schema = _schema(pending, cols)
+        if schema is not None:
+            yield from (_batch(rows, schema) for rows in pending or [batch])
+            pending = []
+        batch = []
+
+    if batch or schema is None:
+        if schema is None:
+            if batch or not pending:
+                pending.append(batch)
+            schema = _schema(pending, cols, end=True)
+        yield from (_batch(rows, schema) for rows in pending or [batch])
+
+def _batch(rows, schema):
+    # Columns whose type couldn't be inferred are written as JSON strings
+    for field in schema:
+        if field.metadata and _JSON in field.metadata:
+            for row in rows:
+                row[field.name] = _json_value(row[field.name])
+
+    return pyarrow.RecordBatch.from_pylist(rows, schema=schema)
+
+# Metadata marking a column of values encoded as JSON
+_JSON = b'rhbztools.json'
+
+def _json_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+def _schema(pending, cols, end=False):
+    # Return the schema of the held batches, or None if a column's type isn't
+    # known yet and we can wait for more. At the end of the bugs, null types
+    # are strings. Otherwise a later value might not match a guessed type, so
+    # columns we gave up on are JSON.
+    fields = []
+    for col in cols:
+        values = [row[col] for rows in pending for row in rows]
+        if col == 'id' and not values:
+            fields.append(pyarrow.field(col, pyarrow.int64()))
+            continue
+
+        type_ = pyarrow.array(values).type
+        if not _complete(type_):
+            if end:
+                type_ = _fill(type_)
+            elif len(pending) < INFER_BATCHES:
+                return None
+            else:
+                fields.append(pyarrow.field(col, pyarrow.string(),
+                                            metadata={_JSON: b''}))
+                continue
+        fields.append(pyarrow.field(col, type_))
+
+    return pyarrow.schema(fields)
+
+def _complete(type_):
+    # Whether type_ contains no null types, which were inferred from values
+    # which were null or empty
+    if pyarrow.types.is_null(type_):
+        return False
+    return all(_complete(type_.field(i).type)
+               for i in range(type_.num_fields))
+
+def _fill(type_):
+    # Replace null types in type_ with strings
+    if pyarrow.types.is_null(type_):
+        return pyarrow.string()
+    if pyarrow.types.is_list(type_):
+        return pyarrow.list_(_fill(type_.value_type))
+    if pyarrow.types.is_struct(type_):
+        return pyarrow.struct([field.with_type(_fill(field.type))
+                               for field in type_])
+    return type_
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError('Arrow and Parquet output require pyarrow')
+
+def write_arrow(bugs, out, fields, batch_size=BATCH_SIZE):
+    """Write bugs to a binary file object as an Arrow IPC stream"""
+    _require_pyarrow()
+
+    writer = None
+    for batch in _batches(bugs, columns(fields), batch_size):
+        if writer is None:
+            writer = pyarrow.ipc.new_stream(out, batch.schema)
+        writer.write_batch(batch)
+    writer.close()
+
+def write_parquet(bugs, out, fields, batch_size=BATCH_SIZE):
+    """Write bugs to a binary file object as Parquet"""
+    _require_pyarrow()
+
+    writer = None
+    for batch in _batches(bugs, columns(fields), batch_size):
+        if writer is None:
+            writer = pyarrow.parquet.ParquetWriter(out, batch.schema)
+        writer.write_batch(batch)
+    writer.close()
+
+# Output format to (writer, whether it writes binary)
+WRITERS = {
+    'csv': (write_csv, False),
+    'arrow': (write_arrow, True),
+    'parquet': (write_parquet, True),
+}
@@ -0,0 +1,207 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""JSON decoders for bugzilla responses.
+
+loads uses the fastest available of orjson, ujson and the standard library.
+iter_array decodes the elements of one array in a JSON document as they are
+read, without holding the whole document in memory.
+"""
+
+import codecs
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+DECODERS = {'json': json.loads}
+if ujson is not None:
+    DECODERS['ujson'] = ujson.loads
+if orjson is not None:
+    DECODERS['orjson'] = orjson.loads
+
+# Preferred decoders, fastest first
+PREFERENCE = ('orjson', 'ujson', 'json')
+
+DEFAULT = next(name for name in PREFERENCE if name in DECODERS)
+
+
+def decoder(name=None):
+    """Return the named decoder function, or the default if name is None"""
+    if name is None:
+        name = DEFAULT
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError('JSON decoder {name} is not available'.format(
+                            name=name))
+
+loads = decoder()
+
+
+class _Incomplete(Exception):
+    pass
+
+
+class _ArrayReader:
+    # Decodes a stream of str chunks, keeping only the unconsumed text
+    _WHITESPACE = ' \t\n\r'
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buf = ''
+        self.pos = 0
+        self.prefix = None
+        self._decoder = json.JSONDecoder()
+
+    def _more(self):
+        for chunk in self.chunks:
+            if chunk:
+                if self.prefix is not None:
+                    self.prefix.append(self.buf[:self.pos])
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return
+        raise _Incomplete()
+
+    def _peek(self):
+        while True:
+            while (self.pos < len(self.buf) and
+                   self.buf[self.pos] in self._WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self._more()
+
+    def find_key(self, key):
+        # Scan the top level object for key, keeping the text scanned so that
+        # the whole document can be decoded if key isn't found. Returns True
+        # if the next value is key's.
+        self.prefix = []
+        depth = 0
+        string = None
+        escaped = False
+        while True:
+            if self.pos >= len(self.buf):
+                self._more()
+
+            c = self.buf[self.pos]
+            self.pos += 1
+            if string is not None:
+                if escaped:
+                    escaped = False
+                elif c == '\\':
+                    escaped = True
+                elif c == '"':
+                    # Only keys are followed by a colon
+                    if (depth == 1 and json.loads(''.join(string) + c) == key
+                            and self._peek() == ':'):
+                        self.pos += 1
+                        self.prefix = None
+                        return True
+                    string = None
+                    continue
+                if depth == 1:
+                    string.append(c)
+            elif c == '"':
+                string = [c]
+            elif c in '{[':
+                depth += 1
+            elif c in '}]':
+                depth -= 1
+                if depth == 0:
+                    return False
+
+    def document(self):
+        # The whole document read so far, and the rest of the stream
+        text = ''.join(self.prefix) + self.buf
+        return text + ''.join(self.chunks)
+
+    def _peek_array(self):
+        try:
+            return self._peek()
+        except _Incomplete:
+            raise ValueError('Truncated JSON array')
+
+    def elements(self):
+        if self._peek_array() != '[':
+            raise ValueError('Expected an array')
+        self.pos += 1
+
+        if self._peek_array() == ']':
+            return
+        while True:
+            yield self._element()
+            c = self._peek_array()
+            self.pos += 1
+            if c == ']':
+                return
+            if c != ',':
+                raise ValueError('Expected , or ] in array')
+            self._peek_array()
+
+    def _element(self):
+        while True:
+            try:
+                (value, end) = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # The element may continue in the next chunk
+                try:
+                    self._more()
+                except _Incomplete:
+                    raise ValueError('Truncated JSON array')
+                continue
+
+            # A number may continue in the next chunk
+            if end == len(self.buf) and not isinstance(value,
+                                                       (dict, list, str)):
+                try:
+                    self._more()
+                    continue
+                except _Incomplete:
+                    pass
+
+            self.pos = end
+            return value
+
+
+def iter_array(chunks, key):
+    """Decode the array value of key in the JSON object read from chunks.
+
+    chunks is an iterable of bytes. Returns a tuple of (elements, document),
+    where elements is a generator of the decoded elements of the array. If the
+    object has no key, elements is None and document is the whole decoded
+    object. Otherwise document is None.
+    """
+    decode = codecs.getincrementaldecoder('utf-8')()
+    chunks = (decode.decode(chunk) for chunk in chunks)
+    reader = _ArrayReader(chunks)
+
+    try:
+        found = reader.find_key(key)
+    except _Incomplete:
+        found = False
+    if not found:
+        return (None, json.loads(reader.document()))
+
+    return (reader.elements(), None)
@@ -15,23 +15,64 @@
 # You should have received a copy of the GNU General Public License
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
-import re
+import hashlib
+import io
+import logging
+import os
+import os.path
 
-class LineReader:
-    # Lines to ignore
-    IGNORE_RE = [re.compile(r) for r in (r'^#', r'^\s*$')]
+from rhbztools import picklecache
+
+LOG = logging.getLogger(__name__)
+
+# Bump whenever the format of a cached keyword index changes
+INDEX_VERSION = 1
+
+
+def _index_path(path):
+    digest = hashlib.sha256(os.path.abspath(path).encode('utf-8'))
+    return picklecache.path('keywords-{digest}.pickle'.format(
+                                digest=digest.hexdigest()[:16]))
 
+def _load_index(index_path):
+    index = picklecache.load(index_path, 'keyword index')
+    if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+        return None
+    return index
+
+def _store_index(index_path, index):
+    picklecache.store(index_path, index, 'keyword index')
+
+
+class LineReader:
     def __init__(self, path):
         super(LineReader, self).__init__()
         self.path = path
 
     def lines(self):
         with open(self.path, 'r') as f:
-            for line in f:
-                if any((r.match(line) for r in self.IGNORE_RE)):
-                    continue
+            yield from self.filter(f)
 
-                yield line.strip()
+    @staticmethod
+    def filter(lines):
+        for line in lines:
+            # Ignore comments and blank lines
+            if line.startswith('#') or not line.strip():
+                continue
+
+            yield line.strip()
+
+
+class _ContentReader(LineReader):
+    # Reads lines from the content of a file which has already been read
+    def __init__(self, path, content):
+        super(_ContentReader, self).__init__(path)
+        self.content = content
+
+    def lines(self):
+        # Decode exactly as open(path, 'r') would
+        with io.TextIOWrapper(io.BytesIO(self.content)) as f:
+            yield from self.filter(f)
 
 
 class InvalidKeyword(Exception):
@@ -51,6 +92,46 @@ class Keywords:
             keyword = words.pop(0)
             self._add_constant(keyword, words)
 
+    @classmethod
+    def load(cls, path):
+        """Return the Keywords in the keywords file at path.
+
+        The parsed keywords are cached, and the cache is used while the file
+        has the same modification time and size, or the same content.
+        """
+        stat = os.stat(path)
+        index_path = _index_path(path)
+        index = _load_index(index_path)
+
+        if (index is not None and index['mtime_ns'] == stat.st_mtime_ns and
+                index['size'] == stat.st_size):
+            return cls._from_constants(index['constants'])
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        if index is not None and index['sha256'] == digest:
+            constants = index['constants']
+        else:
+            LOG.debug('Indexing keywords in {path}'.format(path=path))
+            constants = cls(_ContentReader(path, content)).constants
+
+        _store_index(index_path, {
+            'version': INDEX_VERSION,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': digest,
+            'constants': constants,
+        })
+        return cls._from_constants(constants)
+
+    @classmethod
+    def _from_constants(cls, constants):
+        keywords = cls.__new__(cls)
+        keywords.constants = constants
+        return keywords
+
     def _add_constant(self, keyword, typos=None):
         if typos is None:
             typos = []
@@ -76,42 +157,83 @@ class Keywords:
         add_set = set() if add is None else self._to_canon_set(add)
         remove_set = set() if remove is None else self._to_canon_set(remove)
 
-        def _updater(orig):
-            updated = False
-            output = []
+        return KeywordUpdater(self.constants, add_set, remove_set)
 
-            for word in orig.split():
-                canon_word = self._to_canon(word)
+    def update_string(self, orig, add=None, remove=None):
+        updater = self.updater(add, remove)
+        return updater(orig)
+
+
+class KeywordUpdater:
+    """Add and remove keywords in whiteboards.
+
+    Calling an updater with a whiteboard returns the updated whiteboard, or
+    None if it doesn't need updating. Known keywords are canonicalised,
+    unknown words are left untouched, and missing keywords to add are
+    appended.
+    """
+
+    def __init__(self, constants, add_set, remove_set):
+        super(KeywordUpdater, self).__init__()
+
+        self.constants = constants
+        self.add_set = frozenset(add_set)
+        self.remove_set = frozenset(remove_set)
+
+        # Keywords to add, in the order they are appended
+        self._add = list(add_set)
+
+        # A cache of the canonical keyword for each word seen, or None if it
+        # isn't a keyword. Whiteboards mostly repeat the same few spellings,
+        # so this avoids lowercasing most words.
+        self._canon = {}
 
-                # Ignore unrecognised words
-                if canon_word is None:
-                    output.append(word)
-                    continue
+    def _cache_canon(self, word):
+        canon_word = self.constants.get(word.lower())
+        self._canon[word] = canon_word
+        return canon_word
 
-                if canon_word in remove_set:
-                    updated = True
-                    continue
+    def __call__(self, orig):
+        canon = self._canon
+        remove_set = self.remove_set
+        updated = False
+        output = []
+        present = []
 
-                if canon_word in add_set:
-                    add_set.remove(canon_word)
-                    output.append(canon_word)
-                    updated = updated or (word != canon_word)
-                    continue
+        for word in orig.split():
+            canon_word = canon.get(word, False)
+            if canon_word is False:
+                canon_word = self._cache_canon(word)
 
-                output.append(canon_word)
-                updated = updated or (word != canon_word)
+            # Ignore unrecognised words
+            if canon_word is None:
+                output.append(word)
+                continue
+
+            if canon_word in remove_set:
+                updated = True
+                continue
 
-            for word in add_set:
+            present.append(canon_word)
+            output.append(canon_word)
+            updated = updated or (word != canon_word)
+
+        for word in self._add:
+            if word not in present:
                 updated = True
                 output.append(word)
 
-            if not updated:
-                return None
+        if not updated:
+            return None
 
-            return ' '.join(output)
+        return ' '.join(output)
 
-        return _updater
+    def update_all(self, whiteboards):
+        """Return a list of the result of updating each of whiteboards.
 
-    def update_string(self, orig, add=None, remove=None):
-        updater = self.updater(add, remove)
-        return updater(orig)
+        Identical whiteboards, which are common, are only updated once.
+        """
+        results = {}
+        return [results[wb] if wb in results
+                else results.setdefault(wb, self(wb))
+                for wb in whiteboards]
@@ -0,0 +1,70 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Pickled objects cached in the user's cache directory."""
+
+import appdirs
+import logging
+import os
+import os.path
+import pickle
+import tempfile
+
+LOG = logging.getLogger(__name__)
+
+
+def cache_dir():
+    return appdirs.user_cache_dir('rhbugzilla')
+
+def path(name):
+    """Return the path of the cache file called name"""
+    return os.path.join(cache_dir(), name)
+
+def load(cache_path, what='cache'):
+    """Return the object pickled at cache_path, or None if there isn't one.
+
+    An unreadable cache is ignored. what describes the cache in log messages.
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        LOG.debug('Ignoring unreadable {what} {path}: {msg}'.format(
+                    what=what, path=cache_path, msg=str(ex)))
+        return None
+
+def store(cache_path, obj, what='cache'):
+    """Pickle obj to cache_path, ignoring any error"""
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Write to a temporary file and rename it into place so a concurrent
+        # reader never sees a partially written cache
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except Exception as ex:
+        LOG.debug('Unable to write {what} {path}: {msg}'.format(
+                    what=what, path=cache_path, msg=str(ex)))
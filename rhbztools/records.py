@@ -0,0 +1,151 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Compact in-memory storage for large numbers of bugs.
+
+A BugTable stores bugs column by column rather than as one dict per bug, and
+interns repeated strings like status, component and product. Each bug is
+represented by a BugRecord, a small view of one row of its table which
+supports both dict-style and attribute access.
+"""
+
+import collections.abc
+import sys
+
+# Strings longer than this are unlikely to repeat, so are not interned
+INTERN_MAX_LENGTH = 64
+
+# Marks a field which was not returned for a bug
+_MISSING = object()
+
+
+def _intern(value):
+    if isinstance(value, str):
+        if len(value) <= INTERN_MAX_LENGTH:
+            return sys.intern(value)
+        return value
+    if isinstance(value, list):
+        return [_intern(item) for item in value]
+    return value
+
+
+class BugTable:
+    """A columnar table of bugs"""
+
+    def __init__(self):
+        super(BugTable, self).__init__()
+
+        self.columns = {}
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, row):
+        if not 0 <= row < self._len:
+            raise IndexError(row)
+        return BugRecord(self, row)
+
+    def __iter__(self):
+        return (BugRecord(self, row) for row in range(self._len))
+
+    def append(self, bug):
+        """Add a bug dict to the table, and return its BugRecord"""
+        for field in bug:
+            if field not in self.columns:
+                # Intern field names too, as they're repeated in every
+                # bug converted back to a dict
+                self.columns[sys.intern(field)] = [_MISSING] * self._len
+
+        for (field, column) in self.columns.items():
+            column.append(_intern(bug.get(field, _MISSING)))
+
+        row = self._len
+        self._len += 1
+        return BugRecord(self, row)
+
+    def extend(self, bugs):
+        for bug in bugs:
+            self.append(bug)
+
+
+class BugRecord(collections.abc.Mapping):
+    """A read-only view of one bug in a BugTable"""
+
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, field):
+        column = self._table.columns.get(field)
+        if column is None:
+            raise KeyError(field)
+        value = column[self._row]
+        if value is _MISSING:
+            raise KeyError(field)
+        return value
+
+    def __getattr__(self, field):
+        # Don't look up our own unset slots, e.g. while unpickling
+        if field.startswith('_'):
+            raise AttributeError(field)
+        try:
+            return self[field]
+        except KeyError:
+            raise AttributeError(field)
+
+    def __iter__(self):
+        row = self._row
+        return (field for (field, column) in self._table.columns.items()
+                if column[row] is not _MISSING)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'BugRecord({bug!r})'.format(bug=self.to_dict())
+
+    def to_dict(self):
+        """Return the bug as a dict, e.g. for conversion to JSON"""
+        return dict(self.items())
+
+    def __reduce__(self):
+        # Pickle the bug rather than its whole table
+        return (_unpickle_record, (self.to_dict(),))
+
+
+def _unpickle_record(bug):
+    return BugTable().append(bug)
+
+
+def compact(bugs, table=None):
+    """Return a generator of BugRecords for bugs.
+
+    Each bug dict is added to table, or a new BugTable, as it is yielded, so
+    the original dicts can be freed.
+    """
+    if table is None:
+        table = BugTable()
+    return (table.append(bug) for bug in bugs)
+
+def to_json(obj):
+    """A json default function which converts BugRecords to dicts"""
+    if isinstance(obj, BugRecord):
+        return obj.to_dict()
+    raise TypeError('Object of type {type} is not JSON serializable'.format(
+                        type=type(obj).__name__))
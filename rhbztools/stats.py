@@ -0,0 +1,163 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+"""Timings and sizes of bugzilla requests and BZQL translation.
+
+Session calls each of its hooks with a RequestStats after every request, and
+bzql calls each of bzql.hooks with a bzql.ParseStats after parsing a query.
+Stats is a hook which aggregates both, and dumps them as JSON or in the
+Prometheus text format.
+"""
+
+import dataclasses
+import json
+import threading
+
+from rhbztools import bzql
+from rhbztools.bzql import ParseStats
+
+
+@dataclasses.dataclass
+class RequestStats:
+    method: str
+    # The endpoint, with any bug id replaced by {id}, e.g. 'bug/{id}'
+    endpoint: str
+    status: int
+    # Bytes in the response body
+    size: int
+    retries: int
+    # Seconds until the response headers were received, including DNS
+    # resolution, connection and server time. The transport doesn't report
+    # these separately.
+    ttfb: float
+    # Seconds reading the response body
+    download: float
+    # Seconds decoding the response body. For a streamed response this is
+    # included in download.
+    decode: float
+    total: float
+
+
+def endpoint(path):
+    """Return the endpoint of a REST path, excluding any bug id"""
+    return '/'.join('{id}' if part.isdigit() else part for part in path)
+
+_REQUEST_TIMES = ('ttfb', 'download', 'decode', 'total')
+_PARSE_TIMES = ('parse', 'walk')
+
+
+class Stats:
+    """Aggregate RequestStats and ParseStats.
+
+    A Stats instance is a hook for both Session and bzql: see attach.
+    """
+
+    def __init__(self):
+        super(Stats, self).__init__()
+
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.bzql = dict(count=0, **{t: 0.0 for t in _PARSE_TIMES})
+
+    def __call__(self, stats):
+        with self._lock:
+            if isinstance(stats, ParseStats):
+                self.bzql['count'] += 1
+                for t in _PARSE_TIMES:
+                    self.bzql[t] += getattr(stats, t)
+                return
+
+            key = (stats.method, stats.endpoint)
+            totals = self.requests.get(key)
+            if totals is None:
+                totals = dict(count=0, size=0, retries=0, errors=0,
+                              **{t: 0.0 for t in _REQUEST_TIMES})
+                self.requests[key] = totals
+
+            totals['count'] += 1
+            totals['size'] += stats.size
+            totals['retries'] += stats.retries
+            if stats.status >= 400:
+                totals['errors'] += 1
+            for t in _REQUEST_TIMES:
+                totals[t] += getattr(stats, t)
+
+    def attach(self, session):
+        """Record requests made by session, and all BZQL translations"""
+        session.hooks.append(self)
+        if self not in bzql.hooks:
+            bzql.hooks.append(self)
+
+    def to_dict(self):
+        with self._lock:
+            requests = [dict(method=method, endpoint=endpoint, **totals)
+                        for ((method, endpoint), totals)
+                        in sorted(self.requests.items())]
+            return dict(requests=requests, bzql=dict(self.bzql))
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        stats = self.to_dict()
+        lines = []
+
+        def _metric(name, kind, doc, samples):
+            lines.append('# HELP rhbztools_{name} {doc}'.format(
+                            name=name, doc=doc))
+            lines.append('# TYPE rhbztools_{name} {kind}'.format(
+                            name=name, kind=kind))
+            for (labels, value) in samples:
+                if labels:
+                    labels = '{{{labels}}}'.format(labels=','.join(
+                        '{k}="{v}"'.format(k=k, v=v) for (k, v) in labels))
+                else:
+                    labels = ''
+                lines.append('rhbztools_{name}{labels} {value}'.format(
+                                name=name, labels=labels, value=value))
+
+        def _labels(r, *extra):
+            return ((('method', r['method']), ('endpoint', r['endpoint'])) +
+                    extra)
+
+        requests = stats['requests']
+        _metric('requests_total', 'counter', 'Requests made to bugzilla',
+                [(_labels(r), r['count']) for r in requests])
+        _metric('request_errors_total', 'counter',
+                'Requests which returned an HTTP error',
+                [(_labels(r), r['errors']) for r in requests])
+        _metric('request_retries_total', 'counter', 'Retried requests',
+                [(_labels(r), r['retries']) for r in requests])
+        _metric('response_bytes_total', 'counter', 'Response body bytes',
+                [(_labels(r), r['size']) for r in requests])
+        _metric('request_seconds_total', 'counter',
+                'Seconds spent in each phase of requests',
+                [(_labels(r, ('phase', t)), r[t])
+                 for r in requests for t in _REQUEST_TIMES])
+
+        bzql = stats['bzql']
+        _metric('bzql_queries_total', 'counter', 'BZQL queries translated',
+                [((), bzql['count'])])
+        _metric('bzql_seconds_total', 'counter',
+                'Seconds spent translating BZQL queries',
+                [((('phase', t),), bzql[t]) for t in _PARSE_TIMES])
+
+        return '\n'.join(lines)
+
+FORMATS = {
+    'json': Stats.to_json,
+    'prometheus': Stats.to_prometheus,
+}
@@ -15,8 +15,25 @@
 # You should have received a copy of the GNU General Public License
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
+import fixtures
 import unittest
 
+from rhbztools import bzql
+
 def all_tests():
     test_loader = unittest.TestLoader()
     return test_loader.discover('rhbztools.tests', pattern='test_*.py')
+
+
+class GrammarCacheFixture(fixtures.Fixture):
+    """Compile the tatsu grammar using an empty, temporary cache directory,
+    instead of the user's cache directory.
+    """
+
+    def _setUp(self):
+        self.cache_dir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MockPatch('rhbztools.picklecache.cache_dir',
+                                           return_value=self.cache_dir))
+
+        bzql._compiled_grammar.cache_clear()
+        self.addCleanup(bzql._compiled_grammar.cache_clear)
@@ -0,0 +1,180 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import asyncio
+import fixtures
+import json
+import os.path
+import re
+import testtools
+import types
+from unittest import mock
+
+from aioresponses import aioresponses
+
+from rhbztools import asyncbugzilla
+from rhbztools import bugzilla
+
+BUG_URL = re.compile(r'^https://bugzilla\.redhat\.com/rest/bug\?.*$')
+VALID_LOGIN_URL = re.compile(
+    r'^https://bugzilla\.redhat\.com/rest/valid_login\?.*$')
+
+
+class TestAsyncSession(testtools.TestCase):
+    def setUp(self):
+        super(TestAsyncSession, self).setUp()
+
+        self.fake_creds = {'login': 'user@example.com',
+                           'api_key': 'fake_api_key'}
+        mock_open = mock.mock_open(read_data=json.dumps(self.fake_creds))
+        self.useFixture(fixtures.MonkeyPatch('rhbztools.bugzilla.open',
+                                             mock_open))
+
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MockPatch(
+            'rhbztools.asyncbugzilla.AsyncSession._validated_file',
+            return_value=os.path.join(tmpdir, 'valid_login')))
+
+        self.req = aioresponses()
+        self.req.start()
+        self.addCleanup(self.req.stop)
+
+    def _run(self, coro_func, **kwargs):
+        async def _main():
+            async with asyncbugzilla.AsyncSession(**kwargs) as session:
+                return await coro_func(session)
+        return asyncio.run(_main())
+
+    def _requests(self, method, path):
+        return [(key, calls) for (key, calls) in self.req.requests.items()
+                if key[0] == method and key[1].path == path]
+
+    def test_get_bugs(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.get(BUG_URL, payload={'bugs': [{'id': 1}, {'id': 2}]})
+
+        async def _test(session):
+            return await session.get_bugs([1, 2], fields=['bzurl'])
+
+        r = self._run(_test)
+        self.assertIsInstance(r, types.GeneratorType)
+        self.assertListEqual(
+            [{'id': 1, 'bzurl': 'https://bugzilla.redhat.com/1'},
+             {'id': 2, 'bzurl': 'https://bugzilla.redhat.com/2'}], list(r))
+
+        (key, calls), = self._requests('GET', '/rest/bug')
+        self.assertEqual('1,2', key[1].query['id'])
+        self.assertEqual('id', key[1].query['include_fields'])
+        self.assertEqual('fake_api_key', key[1].query['api_key'])
+
+    def test_query_paged(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.get(BUG_URL, payload={'bugs': [{'id': 1}, {'id': 2}]})
+        self.req.get(BUG_URL, payload={'bugs': [{'id': 3}]})
+
+        async def _test(session):
+            return await session.query('status = "NEW"', page_size=2)
+
+        self.assertListEqual([{'id': 1}, {'id': 2}, {'id': 3}],
+                             list(self._run(_test)))
+
+        offsets = sorted(key[1].query['offset']
+                         for (key, _) in self._requests('GET', '/rest/bug'))
+        self.assertListEqual(['0', '2'], offsets)
+
+    def test_query_paged_server_limit(self):
+        # The server returns fewer bugs than we asked for on pages which
+        # aren't the last
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.get(BUG_URL, payload={'bugs': [{'id': 1}, {'id': 2}]})
+        self.req.get(BUG_URL, payload={'bugs': [{'id': 3}, {'id': 4}]})
+        self.req.get(BUG_URL, payload={'bugs': []})
+
+        async def _test(session):
+            return await session.query('status = "NEW"', page_size=5)
+
+        self.assertListEqual([{'id': i} for i in range(1, 5)],
+                             list(self._run(_test)))
+
+        offsets = sorted(key[1].query['offset']
+                         for (key, _) in self._requests('GET', '/rest/bug'))
+        self.assertListEqual(['0', '2', '4'], offsets)
+
+    def test_query_error(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.get(BUG_URL, payload={'error': True, 'message': 'Bad'})
+
+        async def _test(session):
+            return await session.query('status = "NEW"')
+
+        ex = self.assertRaises(bugzilla.BugzillaError, self._run, _test)
+        self.assertEqual('Bad', str(ex))
+
+    def test_validate_once(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.get(BUG_URL, payload={'bugs': []}, repeat=True)
+
+        async def _test(session):
+            await asyncio.gather(*(session.get_bug(i) for i in range(5)))
+
+        self._run(_test, validate_ttl=None)
+        (_, calls), = self._requests('GET', '/rest/valid_login')
+        self.assertEqual(1, len(calls))
+
+    def test_validate_invalid(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': False})
+
+        async def _test(session):
+            return await session.get_bug(1)
+
+        self.assertRaises(bugzilla.AuthRequired, self._run, _test)
+        self.assertListEqual([], self._requests('GET', '/rest/bug'))
+
+    def test_validate_lazy(self):
+        self.req.get(BUG_URL, payload={'error': True, 'code': 306,
+                                       'message': 'Invalid API key'})
+
+        async def _test(session):
+            return await session.get_bug(1)
+
+        self.assertRaises(bugzilla.AuthRequired, self._run, _test,
+                          validate=False)
+        self.assertListEqual([], self._requests('GET', '/rest/valid_login'))
+
+    def test_retry(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.get(BUG_URL, status=503)
+        self.req.get(BUG_URL, payload={'bugs': [{'id': 1}]})
+
+        async def _test(session):
+            return list(await session.get_bug(1))
+
+        self.assertListEqual([{'id': 1}],
+                             self._run(_test, backoff_factor=0))
+
+    def test_update_bugs(self):
+        self.req.get(VALID_LOGIN_URL, payload={'result': True})
+        self.req.put(re.compile(r'.*/rest/bug/1\?.*'), payload={'bugs': [1]})
+        self.req.put(re.compile(r'.*/rest/bug/2\?.*'),
+                     payload={'error': True, 'message': 'Denied'})
+
+        async def _test(session):
+            return await session.update_bugs([1, 2], {'x': 'y'})
+
+        summary = self._run(_test)
+        self.assertDictEqual({1: {'bugs': [1]}}, summary.updated)
+        self.assertListEqual([2], list(summary.failed))
+        self.assertEqual('Denied', str(summary.failed[2]))
@@ -0,0 +1,152 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import fixtures
+import os.path
+import testtools
+
+from rhbztools import bugcache
+
+class TestBugCache(testtools.TestCase):
+    def setUp(self):
+        super(TestBugCache, self).setUp()
+
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.path = os.path.join(tmpdir, 'bugs.sqlite')
+        self.cache = bugcache.BugCache(self.path)
+        self.addCleanup(self.cache.close)
+
+    def _bug(self, bzid, last_change_time='2019-01-01T00:00:00Z', **kwargs):
+        return dict(id=bzid, last_change_time=last_change_time, **kwargs)
+
+    def test_get_missing(self):
+        self.assertDictEqual({}, self.cache.get([1, 2]))
+
+    def test_put_get(self):
+        bugs = [self._bug(1, summary='one'), self._bug(2, summary='two')]
+        self.cache.put(bugs)
+
+        self.assertDictEqual({1: bugs[0], 2: bugs[1]},
+                             self.cache.get([1, 2, 3]))
+        self.assertDictEqual({2: bugs[1]},
+                             self.cache.get(['2'], fields=['summary']))
+
+    def test_persistent(self):
+        self.cache.put([self._bug(1)])
+        self.cache.close()
+
+        with bugcache.BugCache(self.path) as cache:
+            self.assertDictEqual({1: self._bug(1)}, cache.get([1]))
+
+    def test_fields(self):
+        fields = ['id', 'last_change_time', 'summary']
+        self.cache.put([self._bug(1, summary='one')], fields=fields)
+
+        self.assertIn(1, self.cache.get([1], fields=['id', 'summary']))
+        self.assertNotIn(1, self.cache.get([1], fields=['id', 'status']))
+        self.assertNotIn(1, self.cache.get([1]))
+
+    def test_all_fields(self):
+        fields = ['_all', 'id', 'last_change_time']
+        self.cache.put([self._bug(1, summary='one')], fields=fields)
+
+        self.assertIn(1, self.cache.get([1], fields=['id', 'status']))
+        self.assertIn(1, self.cache.get([1], fields=['_default']))
+
+    def test_default_fields(self):
+        self.cache.put([self._bug(1, summary='one')])
+
+        self.assertIn(1, self.cache.get([1], fields=['_default']))
+        self.assertIn(1, self.cache.get([1], fields=['summary']))
+        # Not fetched by default
+        self.assertNotIn(1, self.cache.get([1], fields=['comments']))
+        self.assertNotIn(1, self.cache.get([1], fields=['_extra']))
+        self.assertNotIn(1, self.cache.get([1], fields=['_all']))
+
+    def test_merge_fields(self):
+        self.cache.put([self._bug(1, summary='one')],
+                       fields=['id', 'last_change_time', 'summary'])
+        self.cache.put([self._bug(1, status='NEW')],
+                       fields=['id', 'last_change_time', 'status'])
+
+        self.assertDictEqual(
+            {1: self._bug(1, summary='one', status='NEW')},
+            self.cache.get([1], fields=['summary', 'status']))
+
+    def test_replace_newer(self):
+        self.cache.put([self._bug(1, summary='one')],
+                       fields=['id', 'last_change_time', 'summary'])
+        newer = self._bug(1, '2019-02-01T00:00:00Z', status='NEW')
+        self.cache.put([newer], fields=['id', 'last_change_time', 'status'])
+
+        self.assertDictEqual({}, self.cache.get([1], fields=['summary']))
+        self.assertDictEqual({1: newer}, self.cache.get([1], ['status']))
+
+    def test_keep_all_fields(self):
+        full = self._bug(1, summary='one', status='NEW')
+        self.cache.put([full])
+        self.cache.put([self._bug(1, summary='one')],
+                       fields=['id', 'last_change_time', 'summary'])
+
+        self.assertDictEqual({1: full}, self.cache.get([1]))
+
+    def test_many(self):
+        bugs = [self._bug(i) for i in range(2000)]
+        self.cache.put(bugs)
+        self.assertEqual(2000, len(self.cache.get(range(2000))))
+
+    def test_clear(self):
+        self.cache.put([self._bug(1)])
+        self.cache.clear()
+        self.assertDictEqual({}, self.cache.get([1]))
+
+
+class TestQueryCache(testtools.TestCase):
+    def setUp(self):
+        super(TestQueryCache, self).setUp()
+
+        self.cache = bugcache.QueryCache(':memory:', ttl=60, max_entries=2)
+        self.addCleanup(self.cache.close)
+
+        self.now = 1000.0
+        self.useFixture(fixtures.MockPatch('rhbztools.bugcache.time.time',
+                                           side_effect=lambda: self.now))
+
+    def test_key_normalised(self):
+        self.cache.put({'f0': 'a', 'o0': 'b'}, [{'id': 1}])
+        self.assertListEqual([{'id': 1}],
+                             self.cache.get({'o0': 'b', 'f0': 'a'}))
+        self.assertIsNone(self.cache.get({'f0': 'a', 'o0': 'c'}))
+
+    def test_ttl(self):
+        self.cache.put({'q': 1}, [])
+        self.now += 59
+        self.assertListEqual([], self.cache.get({'q': 1}))
+        self.now += 1
+        self.assertIsNone(self.cache.get({'q': 1}))
+
+    def test_lru(self):
+        self.cache.put({'q': 1}, [1])
+        self.now += 1
+        self.cache.put({'q': 2}, [2])
+        self.now += 1
+        self.cache.get({'q': 1})
+        self.now += 1
+        self.cache.put({'q': 3}, [3])
+
+        self.assertListEqual([1], self.cache.get({'q': 1}))
+        self.assertIsNone(self.cache.get({'q': 2}))
+        self.assertListEqual([3], self.cache.get({'q': 3}))
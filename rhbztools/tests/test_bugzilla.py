@@ -18,13 +18,44 @@
 import ddt
 import fixtures
 import json
+import os.path
+import requests
 import requests_mock
 from urllib.parse import urlencode
 import testtools
+import time
 import types
 from unittest import mock
 
+from rhbztools import bugcache
 from rhbztools import bugzilla
+from rhbztools import bzqleval
+from rhbztools import jsondecode
+from rhbztools import records
+
+def _page(bugs, request):
+    # Return the page of bugs requested by a paged query
+    if 'offset' not in request.qs:
+        return bugs
+    offset = int(request.qs['offset'][0])
+    return bugs[offset:offset + int(request.qs['limit'][0])]
+
+@ddt.ddt
+class TestRequiredFields(testtools.TestCase):
+    @ddt.data(
+        ([['summary', 'status'], ['status', 'flags']],
+         ['summary', 'status', 'flags']),
+        ([['summary'], None], None),
+        ([['summary'], bzqleval.compile_query('component = "nova"')],
+         ['summary', 'component']),
+        ([['_default'], ['flags']], ['_default', 'flags']),
+        ([['summary', '_all'], ['flags']], ['_all']),
+        ([], []),
+    )
+    @ddt.unpack
+    def test_required_fields(self, consumers, expected):
+        self.assertEqual(expected, bugzilla.required_fields(*consumers))
+
 
 @ddt.ddt
 class TestCreds(testtools.TestCase):
@@ -65,6 +96,12 @@ class _CredentialFileFixture(fixtures.Fixture):
         f = fixtures.MonkeyPatch('rhbztools.bugzilla.open', mock_open)
         self.useFixture(f)
 
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.validated_file = os.path.join(tmpdir, 'valid_login')
+        self.useFixture(fixtures.MockPatch(
+            'rhbztools.bugzilla.Session._validated_file',
+            return_value=self.validated_file))
+
 
 @requests_mock.Mocker()
 class TestSessionValidation(testtools.TestCase):
@@ -103,7 +140,62 @@ class TestSessionValidation(testtools.TestCase):
         ex = self.assertRaises(bugzilla.AuthRequired, bugzilla.Session)
         self.assertEqual(response['message'], ex.args[0])
 
+    def _valid_login_count(self, req):
+        return len([r for r in req.request_history
+                    if r.path == '/rest/valid_login'])
+
+    def test_validate_cached(self, req):
+        req.get('https://bugzilla.redhat.com/rest/valid_login',
+                text=json.dumps({'result': True}))
+
+        bugzilla.Session()
+        bugzilla.Session()
+        self.assertEqual(1, self._valid_login_count(req))
+
+        # Validation expires after the ttl
+        with mock.patch('rhbztools.bugzilla.time.time',
+                        return_value=time.time() + 120):
+            bugzilla.Session(validate_ttl=60)
+        self.assertEqual(2, self._valid_login_count(req))
+
+    def test_validate_uncached(self, req):
+        req.get('https://bugzilla.redhat.com/rest/valid_login',
+                text=json.dumps({'result': True}))
+
+        bugzilla.Session(validate_ttl=None)
+        bugzilla.Session(validate_ttl=None)
+        self.assertEqual(2, self._valid_login_count(req))
+
+    def test_validate_lazy(self, req):
+        response = {
+            'error': True,
+            'code': 306,
+            'message': 'The API key you specified is invalid.',
+        }
+        req.get('https://bugzilla.redhat.com/rest/bug',
+                text=json.dumps(response))
+
+        session = bugzilla.Session(validate=False)
+        self.assertEqual(0, self._valid_login_count(req))
+
+        ex = self.assertRaises(bugzilla.AuthRequired, session.get_bug, 1)
+        self.assertEqual(response['message'], ex.args[0])
+
+    def test_validate_auth_error_forgets(self, req):
+        req.get('https://bugzilla.redhat.com/rest/valid_login',
+                text=json.dumps({'result': True}))
+        req.get('https://bugzilla.redhat.com/rest/bug',
+                text=json.dumps({'error': True, 'code': 410,
+                                 'message': 'You must log in'}))
+
+        session = bugzilla.Session()
+        self.assertRaises(bugzilla.AuthRequired, session.get_bug, 1)
 
+        bugzilla.Session()
+        self.assertEqual(2, self._valid_login_count(req))
+
+
+@ddt.ddt
 class TestSession(testtools.TestCase):
     def setUp(self):
         super(TestSession, self).setUp()
@@ -180,6 +272,19 @@ class TestSession(testtools.TestCase):
         self.assertIsInstance(r, types.GeneratorType)
         self.assertListEqual(['fake_bug'], list(r))
 
+    def test_bugs_field_set(self):
+        bug = {'id': 1, 'summary': 'one', 'status': 'NEW'}
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': [bug]})
+
+        session = bugzilla.Session()
+        r = session.get_bugs([1], fields=['_default', 'bzurl'])
+
+        self.assertListEqual(
+            [dict(bug, bzurl='https://bugzilla.redhat.com/1')], list(r))
+        req = self._find_req_for_path('/rest/bug')
+        self.assertEqual(['_default,id'], req.qs['include_fields'])
+
     # NOTE(mdbooth): This tests the multiple bugs version of PUT, which RHBZ
     # doesn't seem to support
     def _test_update_bug_single(self):
@@ -223,3 +328,533 @@ class TestSession(testtools.TestCase):
                 {'cf_internal_whiteboard': 'test'},
                 bug_req.json())
         self.assertEqual(r, 'fake_response')
+
+    def test_transport_pooled(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     text=json.dumps({'bugs': []}))
+
+        session = bugzilla.Session(pool_size=4, retries=2, timeout=5)
+        list(session.get_bug(1))
+
+        adapter = session.http.get_adapter('https://bugzilla.redhat.com/')
+        self.assertEqual(4, adapter._pool_maxsize)
+        self.assertEqual(2, adapter.max_retries.total)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+        for req in self.req.request_history:
+            self.assertEqual(5, req.timeout)
+
+    def test_transport_custom(self):
+        http = requests.Session()
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     text=json.dumps({'bugs': ['fake_bug']}))
+
+        with mock.patch.object(http, 'request', wraps=http.request) as m:
+            with bugzilla.Session(http=http) as session:
+                self.assertIs(http, session.http)
+                self.assertListEqual(['fake_bug'], list(session.get_bug(1)))
+
+        # valid_login and bug
+        self.assertEqual(2, m.call_count)
+
+    def test_update_bugs(self):
+        for bzid in (1, 2, 3):
+            self.req.put('https://bugzilla.redhat.com/rest/bug/{bzid}'.format(
+                            bzid=bzid), text=json.dumps({'bugs': [bzid]}))
+        self.req.put('https://bugzilla.redhat.com/rest/bug/4',
+                     text=json.dumps({'error': True, 'message': 'Denied'}))
+        self.req.put('https://bugzilla.redhat.com/rest/bug/5',
+                     exc=requests.exceptions.ConnectTimeout)
+
+        session = bugzilla.Session(workers=3)
+        summary = session.update_bugs([1, 2, 3, 4, 5],
+                                      {'cf_internal_whiteboard': 'test'})
+
+        self.assertFalse(summary.ok)
+        self.assertDictEqual({1: {'bugs': [1]}, 2: {'bugs': [2]},
+                              3: {'bugs': [3]}}, summary.updated)
+        self.assertListEqual([4, 5], sorted(summary.failed))
+        self.assertIsInstance(summary.failed[4], bugzilla.BugzillaError)
+        self.assertEqual('Denied', str(summary.failed[4]))
+        self.assertIsInstance(summary.failed[5],
+                              requests.exceptions.ConnectTimeout)
+
+        puts = [req for req in self.req.request_history
+                if req.method == 'PUT']
+        self.assertEqual(5, len(puts))
+        for req in puts:
+            self.assertDictEqual({'cf_internal_whiteboard': 'test'},
+                                 req.json())
+
+    def test_apply_updates(self):
+        self.req.put('https://bugzilla.redhat.com/rest/bug/1',
+                     text=json.dumps({'bugs': [1]}))
+        self.req.put('https://bugzilla.redhat.com/rest/bug/2',
+                     text=json.dumps({'error': True, 'message': 'Denied'}))
+
+        done = []
+        session = bugzilla.Session(workers=2)
+        summary = session.apply_updates(
+            {1: {'cf_devel_whiteboard': 'one'},
+             2: {'cf_devel_whiteboard': 'two'}},
+            callback=lambda bzid, resp, error: done.append((bzid, resp,
+                                                            str(error))))
+
+        self.assertListEqual([(1, {'bugs': [1]}, 'None'), (2, None, 'Denied')],
+                             sorted(done))
+        self.assertListEqual([1], list(summary.updated))
+        self.assertListEqual([2], list(summary.failed))
+
+        bodies = {req.path: req.json() for req in self.req.request_history
+                  if req.method == 'PUT'}
+        self.assertDictEqual({'/rest/bug/1': {'cf_devel_whiteboard': 'one'},
+                              '/rest/bug/2': {'cf_devel_whiteboard': 'two'}},
+                             bodies)
+
+    def test_apply_updates_interrupted(self):
+        self.req.put(requests_mock.ANY, text=json.dumps({}))
+
+        def _interrupt(bzid, resp, error):
+            raise KeyboardInterrupt()
+
+        session = bugzilla.Session(workers=1)
+        self.assertRaises(KeyboardInterrupt, session.apply_updates,
+                          {bzid: {} for bzid in range(1, 21)},
+                          callback=_interrupt)
+
+        # Updates which hadn't started were cancelled
+        puts = [req for req in self.req.request_history
+                if req.method == 'PUT']
+        self.assertLess(len(puts), 20)
+
+    def test_rate_limit(self):
+        self.req.put(requests_mock.ANY, text=json.dumps({}))
+
+        session = bugzilla.Session(rate_limit=5)
+        with mock.patch('rhbztools.bugzilla.time.sleep') as sleep:
+            summary = session.update_bugs([1, 2, 3], {})
+
+        self.assertTrue(summary.ok)
+        # valid_login plus 3 updates: all but the first must wait
+        self.assertEqual(3, sleep.call_count)
+        for (args, _) in sleep.call_args_list:
+            self.assertLessEqual(args[0], 0.8)
+
+    def _paged_response(self, bugs, page_size, server_limit=None):
+        # server_limit simulates bugzilla's own cap on limit
+        def _callback(request, context):
+            self.assertEqual([str(page_size)], request.qs['limit'])
+            self.assertEqual(['bug_id'], request.qs['order'])
+            offset = int(request.qs['offset'][0])
+            limit = min(page_size, server_limit or page_size)
+            return {'bugs': bugs[offset:offset + limit]}
+        return _callback
+
+    @ddt.data(False, True)
+    def test_query_paged(self, prefetch):
+        bugs = [{'id': i} for i in range(1, 8)]
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json=self._paged_response(bugs, 3))
+
+        session = bugzilla.Session()
+        r = session.query('status = "NEW"', page_size=3, prefetch=prefetch)
+
+        self.assertIsInstance(r, types.GeneratorType)
+        self.assertListEqual(bugs, list(r))
+
+        offsets = [req.qs['offset'] for req in self.req.request_history
+                   if req.path == '/rest/bug']
+        self.assertListEqual([['0'], ['3'], ['6']], offsets)
+
+    @ddt.data(False, True)
+    def test_query_paged_server_limit(self, prefetch):
+        # The server returns fewer bugs than we asked for on pages which
+        # aren't the last
+        bugs = [{'id': i} for i in range(1, 8)]
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json=self._paged_response(bugs, 5, server_limit=2))
+
+        session = bugzilla.Session()
+        r = session.query('status = "NEW"', page_size=5, prefetch=prefetch)
+
+        self.assertListEqual(bugs, list(r))
+        offsets = [req.qs['offset'] for req in self.req.request_history
+                   if req.path == '/rest/bug']
+        self.assertListEqual([['0'], ['2'], ['4'], ['6']], offsets)
+
+    def test_query_paged_lazy(self):
+        bugs = [{'id': i} for i in range(1, 8)]
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json=self._paged_response(bugs, 3))
+
+        session = bugzilla.Session()
+        r = session.query('status = "NEW"', page_size=3)
+
+        # Only the first page is fetched before iteration
+        self.assertEqual({'id': 1}, next(r))
+        bug_reqs = [req for req in self.req.request_history
+                    if req.path == '/rest/bug']
+        self.assertEqual(1, len(bug_reqs))
+
+    def test_query_paged_error(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'error': True, 'message': 'Bad query'})
+
+        session = bugzilla.Session()
+        ex = self.assertRaises(bugzilla.BugzillaError, session.query,
+                               'status = "NEW"')
+        self.assertEqual('Bad query', str(ex))
+
+    def test_query_unpaged(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': ['fake_bug']})
+
+        session = bugzilla.Session()
+        r = session.query('status = "NEW"', page_size=None)
+
+        self.assertListEqual(['fake_bug'], list(r))
+        req = self._find_req_for_path('/rest/bug')
+        self.assertNotIn('limit', req.qs)
+
+    def test_query_stream(self):
+        bugs = [{'id': i, 'summary': 'Bug {i}'.format(i=i)}
+                for i in range(100)]
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': bugs, 'faults': []})
+
+        session = bugzilla.Session(stream=True)
+        session.STREAM_CHUNK_SIZE = 64
+        r = session.query('status = "NEW"', fields=['bzurl', 'summary'],
+                          page_size=None)
+
+        self.assertIsInstance(r, types.GeneratorType)
+        self.assertListEqual(
+            [dict(bug, bzurl='https://bugzilla.redhat.com/{i}'.format(i=i))
+             for (i, bug) in enumerate(bugs)],
+            list(r))
+
+    def test_query_stream_error(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'error': True, 'message': 'Bad query'})
+
+        session = bugzilla.Session(stream=True)
+        ex = self.assertRaises(bugzilla.BugzillaError, session.query,
+                               'status = "NEW"', page_size=None)
+        self.assertEqual('Bad query', str(ex))
+
+    @ddt.data('json', 'orjson')
+    def test_json_decoder(self, name):
+        if name not in jsondecode.DECODERS:
+            self.skipTest('{name} is not installed'.format(name=name))
+
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': [{'id': 1}]})
+
+        session = bugzilla.Session(json_decoder=name)
+        self.assertListEqual([{'id': 1}], list(session.get_bugs([1])))
+
+    def test_debug_lazy(self):
+        formatted = []
+
+        class _Response(dict):
+            def __str__(self):
+                formatted.append(self)
+                return super(_Response, self).__str__()
+
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': [{'id': 1}]})
+        session = bugzilla.Session()
+        session._loads = lambda content: _Response(json.loads(content))
+
+        # The response is only formatted if debug logging is enabled
+        with mock.patch.object(bugzilla.LOG, 'isEnabledFor',
+                               return_value=False):
+            session._get(['bug'])
+        self.assertEqual(0, len(formatted))
+
+        with mock.patch.object(bugzilla.LOG, 'isEnabledFor',
+                               return_value=True):
+            session._get(['bug'])
+        self.assertEqual(1, len(formatted))
+
+    def test_hooks(self):
+        hook = mock.Mock()
+        session = bugzilla.Session(hooks=[hook])
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': [{'id': 1}]})
+        self.req.put('https://bugzilla.redhat.com/rest/bug/1', json={})
+
+        list(session.get_bugs([1]))
+        session.update_bug(1, {'status': 'POST'})
+
+        calls = [c[0][0] for c in hook.call_args_list]
+        self.assertEqual([('GET', 'valid_login'), ('GET', 'bug'),
+                          ('PUT', 'bug/{id}')],
+                         [(c.method, c.endpoint) for c in calls])
+        get = calls[1]
+        self.assertEqual(200, get.status)
+        self.assertEqual(len(json.dumps({'bugs': [{'id': 1}]})), get.size)
+        self.assertEqual(0, get.retries)
+        self.assertGreaterEqual(get.total, get.download + get.decode)
+
+    def test_hooks_stream(self):
+        hook = mock.Mock()
+        session = bugzilla.Session(hooks=[hook], stream=True)
+        body = {'bugs': [{'id': 1}, {'id': 2}]}
+        self.req.get('https://bugzilla.redhat.com/rest/bug', json=body)
+
+        r = session.query('status = "NEW"', page_size=None)
+        self.assertEqual(1, hook.call_count)
+
+        # A streamed request is reported when it has been fully read
+        self.assertEqual(2, len(list(r)))
+        self.assertEqual(2, hook.call_count)
+        self.assertEqual(len(json.dumps(body)), hook.call_args[0][0].size)
+
+    def test_query_compact(self):
+        bugs = [{'id': 1, 'status': 'NEW'}, {'id': 2, 'status': 'NEW'}]
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': bugs})
+
+        session = bugzilla.Session()
+        r = list(session.query('status = "NEW"', page_size=None,
+                               compact=True))
+
+        self.assertListEqual(bugs, r)
+        self.assertIsInstance(r[0], records.BugRecord)
+        self.assertEqual('NEW', r[1].status)
+
+    def test_query_plan(self):
+        bugs = [
+            {'id': 1, 'summary': 'Boot fails', 'component': 'nova'},
+            {'id': 2, 'summary': 'Attach fails', 'component': 'nova'},
+        ]
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'bugs': bugs})
+
+        session = bugzilla.Session()
+        r = session.query('status = "NEW" and summary ~ "^boot"',
+                          fields=['component'], page_size=None, plan=True)
+
+        self.assertListEqual([{'id': 1, 'component': 'nova'}], list(r))
+        req = self._find_req_for_path('/rest/bug')
+        self.assertNotIn('o1', req.qs)
+        self.assertEqual(['component,summary,id'], req.qs['include_fields'])
+
+    def test_query_plan_default_fields(self):
+        # cf_devel_whiteboard isn't a default field, so is only returned if
+        # requested
+        def _callback(request, context):
+            fields = request.qs.get('include_fields', [''])[0].split(',')
+            bug = {'id': 1, 'status': 'NEW'}
+            if 'cf_devel_whiteboard' in fields:
+                bug['cf_devel_whiteboard'] = 'NeedsAutomation'
+            return {'bugs': [bug]}
+        self.req.get('https://bugzilla.redhat.com/rest/bug', json=_callback)
+
+        session = bugzilla.Session()
+        r = session.query('status = "NEW" and cf_devel_whiteboard ~ "^needs"',
+                          page_size=None, plan=True)
+
+        self.assertListEqual([{'id': 1, 'status': 'NEW',
+                               'cf_devel_whiteboard': 'NeedsAutomation'}],
+                             list(r))
+        req = self._find_req_for_path('/rest/bug')
+        self.assertEqual(['_default,cf_devel_whiteboard,id'],
+                         req.qs['include_fields'])
+
+    def test_id_chunks(self):
+        chunks = bugzilla.Session._id_chunks([1, 22, 333, 4444, 5], 10)
+        self.assertListEqual([['1', '22'], ['333', '4444'], ['5']],
+                             list(chunks))
+
+    @ddt.data(True, False)
+    def test_bugs_chunked(self, ordered):
+        def _callback(request, context):
+            ids = request.qs['id'][0].split(',')
+            self.assertLessEqual(len(urlencode({'id': ','.join(ids)})),
+                                 len('id=') + 20)
+            return {'bugs': [{'id': int(bzid)} for bzid in ids]}
+        self.req.get('https://bugzilla.redhat.com/rest/bug', json=_callback)
+
+        bzids = list(range(100, 130))
+        session = bugzilla.Session()
+        with mock.patch.object(session, 'MAX_ID_LENGTH', 20):
+            r = session.get_bugs(bzids, ordered=ordered)
+
+        self.assertIsInstance(r, types.GeneratorType)
+        bugs = [bug['id'] for bug in r]
+        if ordered:
+            self.assertListEqual(bzids, bugs)
+        else:
+            self.assertListEqual(bzids, sorted(bugs))
+
+        bug_reqs = [req for req in self.req.request_history
+                    if req.path == '/rest/bug']
+        self.assertEqual(10, len(bug_reqs))
+
+    def test_bugs_chunked_error(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'error': True, 'message': 'Denied'})
+
+        session = bugzilla.Session()
+        with mock.patch.object(session, 'MAX_ID_LENGTH', 20):
+            ex = self.assertRaises(bugzilla.BugzillaError, session.get_bugs,
+                                   list(range(100, 130)))
+        self.assertEqual('Denied', str(ex))
+
+    def _cached_session(self, server_bugs):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        cache = bugcache.BugCache(tmpdir + '/bugs.sqlite')
+        self.addCleanup(cache.close)
+
+        def _callback(request, context):
+            bugs = server_bugs
+            if 'id' in request.qs:
+                ids = [int(i) for i in request.qs['id'][0].split(',')]
+                bugs = [bug for bug in bugs if bug['id'] in ids]
+            if 'last_change_time' in request.qs:
+                since = request.qs['last_change_time'][0].upper()
+                bugs = [bug for bug in bugs
+                        if bug['last_change_time'] >= since]
+            bugs = _page(bugs, request)
+            # Like bugzilla, comments is only returned if asked for
+            fields = request.qs.get('include_fields', ['_default'])[0]
+            fields = fields.split(',')
+            bugs = [{k: v for k, v in bug.items()
+                     if k in fields or
+                        ('_default' in fields and k != 'comments')}
+                    for bug in bugs]
+            return {'bugs': bugs}
+        self.req.get('https://bugzilla.redhat.com/rest/bug', json=_callback)
+
+        return bugzilla.Session(cache=cache)
+
+    def _full_fetches(self):
+        # Requests for bug data other than id and last_change_time
+        return [req.qs.get('id') for req in self.req.request_history
+                if req.path == '/rest/bug' and
+                req.qs.get('include_fields') != ['last_change_time,id']]
+
+    def test_cached_get_bugs(self):
+        server_bugs = [
+            {'id': 1, 'last_change_time': '2019-01-01T00:00:00Z', 'x': 'a'},
+            {'id': 2, 'last_change_time': '2019-01-01T00:00:00Z', 'x': 'b'},
+        ]
+        session = self._cached_session(server_bugs)
+
+        self.assertListEqual([{'id': 1, 'x': 'a'}],
+                             list(session.get_bugs([1], fields=['x'])))
+        self.assertListEqual([['1']], self._full_fetches())
+
+        # Bug 1 is served from the cache, bug 2 is fetched
+        self.req.reset_mock()
+        self.assertListEqual([{'id': 1, 'x': 'a'}, {'id': 2, 'x': 'b'}],
+                             list(session.get_bugs([1, 2], fields=['x'])))
+        self.assertListEqual([['2']], self._full_fetches())
+
+        # Only the changed bug is refetched
+        server_bugs[1] = {'id': 2, 'last_change_time': '2019-02-01T00:00:00Z',
+                          'x': 'c'}
+        self.req.reset_mock()
+        self.assertListEqual(
+            [{'id': 1, 'x': 'a', 'bzurl': 'https://bugzilla.redhat.com/1'},
+             {'id': 2, 'x': 'c', 'bzurl': 'https://bugzilla.redhat.com/2'}],
+            list(session.get_bugs([1, 2], fields=['x', 'bzurl'])))
+        self.assertListEqual([['2']], self._full_fetches())
+
+    def test_cached_extra_fields(self):
+        server_bugs = [
+            {'id': 1, 'last_change_time': '2019-01-01T00:00:00Z', 'x': 'a',
+             'comments': ['Comment']},
+        ]
+        session = self._cached_session(server_bugs)
+
+        self.assertListEqual(
+            [{'id': 1, 'last_change_time': '2019-01-01T00:00:00Z', 'x': 'a'}],
+            list(session.get_bugs([1])))
+
+        # The default fields don't include comments, so they are fetched
+        self.req.reset_mock()
+        self.assertListEqual([{'id': 1, 'comments': ['Comment']}],
+                             list(session.get_bugs([1], fields=['comments'])))
+        self.assertListEqual([['1']], self._full_fetches())
+
+        # Fields which were fetched with the default fields are cached
+        self.req.reset_mock()
+        self.assertListEqual([{'id': 1, 'x': 'a'}],
+                             list(session.get_bugs([1], fields=['x'])))
+        self.assertListEqual([], self._full_fetches())
+
+    def test_cached_query(self):
+        server_bugs = [
+            {'id': 1, 'last_change_time': '2019-01-01T00:00:00Z', 'x': 'a'},
+            {'id': 2, 'last_change_time': '2019-01-01T00:00:00Z', 'x': 'b'},
+        ]
+        session = self._cached_session(server_bugs)
+
+        self.assertListEqual(server_bugs, list(session.query('x = "a"')))
+        self.assertListEqual([['1,2']], self._full_fetches())
+
+        server_bugs[0] = {'id': 1, 'last_change_time': '2019-02-01T00:00:00Z',
+                          'x': 'c'}
+        self.req.reset_mock()
+        self.assertListEqual(server_bugs, list(session.query('x = "a"')))
+        self.assertListEqual([['1']], self._full_fetches())
+
+    def test_query_many(self):
+        def _callback(request, context):
+            return {'bugs': _page([{'id': int(request.qs['v0'][0])}],
+                                  request)}
+        self.req.get('https://bugzilla.redhat.com/rest/bug', json=_callback)
+
+        session = bugzilla.Session()
+        queries = {'b': 'bug_id = 2', 'a': 'bug_id = 1', 'c': 'bug_id = 3'}
+        results = session.query_many(queries)
+
+        self.assertListEqual(['b', 'a', 'c'], list(results))
+        self.assertDictEqual({'a': [{'id': 1}], 'b': [{'id': 2}],
+                              'c': [{'id': 3}]}, results)
+
+        valid_login = [req for req in self.req.request_history
+                       if req.path == '/rest/valid_login']
+        self.assertEqual(1, len(valid_login))
+
+    def test_query_many_error(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json={'error': True, 'message': 'Bad'})
+
+        session = bugzilla.Session()
+        self.assertRaises(bugzilla.BugzillaError, session.query_many,
+                          {'a': 'bug_id = 1'})
+
+    def test_query_cache(self):
+        self.req.get('https://bugzilla.redhat.com/rest/bug',
+                     json=lambda request, context: {
+                        'bugs': _page([{'id': 1}], request)})
+
+        query_cache = bugcache.QueryCache(':memory:')
+        self.addCleanup(query_cache.close)
+        session = bugzilla.Session(query_cache=query_cache)
+
+        def _bug_requests():
+            # Queries, rather than the requests for each page
+            return len([req for req in self.req.request_history
+                        if req.path == '/rest/bug' and
+                           req.qs['offset'] == ['0']])
+
+        self.assertListEqual([{'id': 1}],
+                             list(session.query('x = 1', fields=['id'])))
+        self.assertEqual(1, _bug_requests())
+
+        # Equivalent query and fields are served from the cache
+        r = session.query('x  =  1', fields=['id', 'id'])
+        self.assertIsInstance(r, types.GeneratorType)
+        self.assertListEqual([{'id': 1}], list(r))
+        self.assertEqual(1, _bug_requests())
+
+        # Different fields or an explicit refresh go to the server
+        list(session.query('x = 1'))
+        self.assertEqual(2, _bug_requests())
+        list(session.query('x = 1', fields=['id'], refresh=True))
+        self.assertEqual(3, _bug_requests())
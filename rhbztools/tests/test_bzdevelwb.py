@@ -0,0 +1,304 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+
+import fixtures
+import os.path
+import tempfile
+from unittest import mock
+
+import testtools
+
+from rhbztools import bzdevelwb
+from rhbztools.bugzilla import BugzillaError, UpdateSummary
+from rhbztools.bzdevelwb import Change
+
+
+def _session(whiteboards, failed=None):
+    bz = mock.Mock()
+    bz.get_bugs.side_effect = lambda bzids, fields: [
+        {'id': bzid, 'cf_devel_whiteboard': whiteboards[bzid]}
+        for bzid in bzids if bzid in whiteboards]
+    bz.apply_updates.return_value = UpdateSummary(failed=failed or {})
+    return bz
+
+class _FakeBugzilla:
+    # Simulates bugzilla's mid-air collision check, unless honour_delta_ts is
+    # False. interfere is called before each round of updates, so tests can
+    # change bugs behind our back.
+    def __init__(self, whiteboards, interfere=None, honour_delta_ts=True):
+        self.bugs = {bzid: {'id': bzid, 'cf_devel_whiteboard': wb,
+                            'last_change_time': 0}
+                     for (bzid, wb) in whiteboards.items()}
+        self.interfere = interfere
+        self.honour_delta_ts = honour_delta_ts
+        self.sent = []
+
+    def get_bugs(self, bzids, fields):
+        return [dict(self.bugs[bzid]) for bzid in bzids]
+
+    def change(self, bzid, whiteboard):
+        bug = self.bugs[bzid]
+        bug['cf_devel_whiteboard'] = whiteboard
+        bug['last_change_time'] += 1
+
+    def apply_updates(self, updates, callback=None):
+        self.sent.append(updates)
+        if self.interfere is not None:
+            self.interfere(self)
+
+        summary = UpdateSummary()
+        for (bzid, values) in updates.items():
+            if self.honour_delta_ts and \
+                    values.get('delta_ts', self.bugs[bzid]['last_change_time']) \
+                    != self.bugs[bzid]['last_change_time']:
+                summary.failed[bzid] = BugzillaError('Mid-air collision')
+                continue
+            self.change(bzid, values['cf_devel_whiteboard'])
+            summary.updated[bzid] = {}
+        return summary
+
+def _updater(whiteboard):
+    words = whiteboard.split()
+    if 'Old' not in words:
+        return None
+    return ' '.join('New' if word == 'Old' else word for word in words)
+
+
+class TestPlan(testtools.TestCase):
+    def test_plan(self):
+        bz = _session({1: 'Old', 2: 'New', 3: 'Keep Old'})
+
+        changes = bzdevelwb.plan_devel_whiteboard(bz, [1, 2, 3], _updater)
+
+        self.assertListEqual([Change(1, 'Old', 'New'),
+                              Change(3, 'Keep Old', 'Keep New')], changes)
+        bz.get_bugs.assert_called_once_with(
+            [1, 2, 3], fields=['cf_devel_whiteboard', 'last_change_time'])
+
+    def test_plan_last_change_time(self):
+        bz = _FakeBugzilla({1: 'Old'})
+        bz.change(1, 'Old')
+
+        self.assertListEqual([Change(1, 'Old', 'New', 1)],
+                             bzdevelwb.plan_devel_whiteboard(bz, [1],
+                                                             _updater))
+
+    def test_plan_update_all(self):
+        bz = _session({1: 'Old', 2: 'Same'})
+        updater = mock.Mock()
+        updater.update_all.return_value = ['New', 'Same']
+
+        changes = bzdevelwb.plan_devel_whiteboard(bz, [1, 2], updater)
+
+        self.assertListEqual([Change(1, 'Old', 'New')], changes)
+        updater.update_all.assert_called_once_with(['Old', 'Same'])
+        updater.assert_not_called()
+
+    def test_check_plan(self):
+        bz = _session({1: 'Old', 2: 'New', 3: 'Other'})
+        changes = [Change(bzid, 'Old', 'New') for bzid in (1, 2, 3)]
+
+        (todo, done, conflicts) = bzdevelwb.check_plan(bz, changes)
+
+        self.assertListEqual([Change(1, 'Old', 'New')], todo)
+        self.assertListEqual([2], done)
+        self.assertListEqual([3], conflicts)
+
+    def test_check_plan_last_change_time(self):
+        # The plan is checked against the bug as it is now, so the update
+        # must be checked against now too
+        bz = _FakeBugzilla({1: 'Old', 2: 'Old'})
+        bz.change(1, 'Old')
+        bz.change(2, 'Other')
+        changes = [Change(bzid, 'Old', 'New', 0) for bzid in (1, 2)]
+
+        (todo, done, conflicts) = bzdevelwb.check_plan(bz, changes)
+
+        self.assertListEqual([Change(1, 'Old', 'New', 1)], todo)
+        self.assertListEqual([], done)
+        self.assertListEqual([2], conflicts)
+
+    def test_save_load_plan(self):
+        changes = [Change(1, 'Old', 'New'), Change(2, '', 'New', '2020')]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'plan.json')
+            bzdevelwb.save_plan(path, changes)
+            self.assertListEqual(changes, bzdevelwb.load_plan(path))
+
+
+class TestFormat(testtools.TestCase):
+    def test_format_change(self):
+        self.assertEqual('12345: -NeedsManualVer +NeedsAutomation',
+                         bzdevelwb.format_change(Change(
+                            12345, 'Foo NeedsManualVer',
+                            'Foo NeedsAutomation')))
+
+    def test_format_change_duplicates(self):
+        self.assertEqual('1: -Foo', bzdevelwb.format_change(
+                            Change(1, 'Foo Bar Foo', 'Foo Bar')))
+
+    def test_format_change_reorder(self):
+        self.assertEqual("1: 'Foo  Bar' -> 'Bar Foo'",
+                         bzdevelwb.format_change(
+                            Change(1, 'Foo  Bar', 'Bar Foo')))
+
+
+class TestApply(testtools.TestCase):
+    def test_apply_changes(self):
+        error = Exception('Denied')
+        bz = _session({}, failed={2: error})
+
+        failed = bzdevelwb.apply_changes(
+            bz, [Change(1, 'Old', 'New'), Change(2, '', 'Other')])
+
+        self.assertDictEqual({2: error}, failed)
+        (updates,), kwargs = bz.apply_updates.call_args
+        self.assertDictEqual({1: {'cf_devel_whiteboard': 'New'},
+                              2: {'cf_devel_whiteboard': 'Other'}}, updates)
+        self.assertIn('callback', kwargs)
+
+    def test_update_devel_whiteboard(self):
+        bz = _session({1: 'Old', 2: 'New'})
+
+        self.assertDictEqual({}, bzdevelwb.update_devel_whiteboard(
+                                    bz, [1, 2], _updater))
+        bz.apply_updates.assert_called_once_with(
+            {1: {'cf_devel_whiteboard': 'New'}}, callback=mock.ANY)
+
+    def test_apply_changes_no_compare_and_set(self):
+        bz = _FakeBugzilla({1: 'Old'},
+                           interfere=lambda bz: bz.change(1, 'Old Other'))
+
+        failed = bzdevelwb.apply_changes(bz, [Change(1, 'Old', 'New', 0)])
+
+        self.assertDictEqual({}, failed)
+        self.assertListEqual([{1: {'cf_devel_whiteboard': 'New'}}], bz.sent)
+        # Clobbered
+        self.assertEqual('New', bz.bugs[1]['cf_devel_whiteboard'])
+
+
+class TestCompareAndSet(testtools.TestCase):
+    def _interfere_once(self, bzid, whiteboard):
+        def _interfere(bz):
+            if len(bz.sent) == 1:
+                bz.change(bzid, whiteboard)
+        return _interfere
+
+    def test_no_conflict(self):
+        bz = _FakeBugzilla({1: 'Old', 2: 'Old'})
+
+        failed = bzdevelwb.update_devel_whiteboard(bz, [1, 2], _updater,
+                                                   compare_and_set=True)
+
+        self.assertDictEqual({}, failed)
+        self.assertListEqual([
+            {1: {'cf_devel_whiteboard': 'New', 'delta_ts': 0},
+             2: {'cf_devel_whiteboard': 'New', 'delta_ts': 0}}], bz.sent)
+
+    def test_conflict_reapplied(self):
+        bz = _FakeBugzilla({1: 'Old', 2: 'Old'},
+                           interfere=self._interfere_once(2, 'Old Other'))
+
+        failed = bzdevelwb.update_devel_whiteboard(bz, [1, 2], _updater,
+                                                   compare_and_set=True)
+
+        self.assertDictEqual({}, failed)
+        # Only the conflicting bug is updated again, from its new value
+        self.assertListEqual([
+            {1: {'cf_devel_whiteboard': 'New', 'delta_ts': 0},
+             2: {'cf_devel_whiteboard': 'New', 'delta_ts': 0}},
+            {2: {'cf_devel_whiteboard': 'New Other', 'delta_ts': 1}}],
+            bz.sent)
+        self.assertEqual('New', bz.bugs[1]['cf_devel_whiteboard'])
+        self.assertEqual('New Other', bz.bugs[2]['cf_devel_whiteboard'])
+
+    def test_conflict_no_longer_needed(self):
+        bz = _FakeBugzilla({1: 'Old'},
+                           interfere=self._interfere_once(1, 'New'))
+
+        failed = bzdevelwb.update_devel_whiteboard(bz, [1], _updater,
+                                                   compare_and_set=True)
+
+        self.assertDictEqual({}, failed)
+        self.assertEqual(1, len(bz.sent))
+
+    def test_conflict_without_updater(self):
+        bz = _FakeBugzilla({1: 'Old'},
+                           interfere=self._interfere_once(1, 'Other'))
+
+        failed = bzdevelwb.apply_changes(bz, [Change(1, 'Old', 'New', 0)],
+                                         compare_and_set=True)
+
+        self.assertListEqual([1], list(failed))
+        self.assertIsInstance(failed[1], bzdevelwb.ConflictError)
+        self.assertEqual('Other', bz.bugs[1]['cf_devel_whiteboard'])
+
+    def test_changed_before_update(self):
+        # A bug which changed since it was read is caught by rereading it
+        # before the update, even if bugzilla ignores delta_ts
+        bz = _FakeBugzilla({1: 'Old', 2: 'Old'}, honour_delta_ts=False)
+        changes = bzdevelwb.plan_devel_whiteboard(bz, [1, 2], _updater)
+        bz.change(2, 'Old Other')
+
+        failed = bzdevelwb.apply_changes(bz, changes, compare_and_set=True,
+                                         updater=_updater)
+
+        self.assertDictEqual({}, failed)
+        self.assertListEqual([
+            {1: {'cf_devel_whiteboard': 'New', 'delta_ts': 0}},
+            {2: {'cf_devel_whiteboard': 'New Other', 'delta_ts': 1}}],
+            bz.sent)
+        self.assertEqual('New Other', bz.bugs[2]['cf_devel_whiteboard'])
+
+    def test_check_chunks(self):
+        self.useFixture(fixtures.MockPatch(
+            'rhbztools.bzdevelwb.CHECK_CHUNK_SIZE', 1))
+        bz = _FakeBugzilla({1: 'Old', 2: 'Old'}, honour_delta_ts=False)
+        changes = bzdevelwb.plan_devel_whiteboard(bz, [1, 2], _updater)
+
+        # Bug 2 changes while bug 1 is being updated
+        def _interfere(bz):
+            if len(bz.sent) == 1:
+                bz.change(2, 'Old Other')
+        bz.interfere = _interfere
+
+        failed = bzdevelwb.apply_changes(bz, changes, compare_and_set=True,
+                                         updater=_updater)
+
+        self.assertDictEqual({}, failed)
+        self.assertEqual('New Other', bz.bugs[2]['cf_devel_whiteboard'])
+
+    def test_conflict_retries(self):
+        bz = _FakeBugzilla({1: 'Old'},
+                           interfere=lambda bz: bz.change(1, 'Old'))
+
+        failed = bzdevelwb.update_devel_whiteboard(bz, [1], _updater,
+                                                   compare_and_set=True)
+
+        self.assertListEqual([1], list(failed))
+        self.assertEqual(bzdevelwb.CONFLICT_RETRIES + 1, len(bz.sent))
+
+    def test_other_failure_not_retried(self):
+        bz = _FakeBugzilla({1: 'Old'})
+        bz.apply_updates = mock.Mock(return_value=UpdateSummary(
+                                        failed={1: BugzillaError('Denied')}))
+
+        failed = bzdevelwb.update_devel_whiteboard(bz, [1], _updater,
+                                                   compare_and_set=True)
+
+        self.assertListEqual([1], list(failed))
+        bz.apply_updates.assert_called_once()
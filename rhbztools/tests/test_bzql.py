@@ -16,22 +16,35 @@
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
 import ddt
+import fixtures
+import os
 import testtools
+from unittest import mock
 
 import tatsu.exceptions
 
 from rhbztools import bzql
+from rhbztools.tests import GrammarCacheFixture
+
+# Shared by every test which uses the tatsu parser, so the grammar is only
+# compiled once
+_grammar_cache = GrammarCacheFixture()
+
+def setUpModule():
+    _grammar_cache.setUp()
+
+def tearDownModule():
+    _grammar_cache.cleanUp()
 
 @ddt.ddt
 class TestBZQL(testtools.TestCase):
-    def __init__(self, *args, **kwargs):
-        super(TestBZQL, self).__init__(*args, **kwargs)
-
-        self.parser = bzql.parser()
+    BACKEND = 'fast'
 
     def setUp(self):
         super(TestBZQL, self).setUp()
 
+        self.parser = bzql.parser(self.BACKEND)
+
     @ddt.data(
         ('classification = "Red Hat"',
          {'f0': 'classification', 'o0': 'equals', 'v0': 'Red Hat'}),
@@ -263,3 +276,163 @@ class TestBZQL(testtools.TestCase):
 
         params = self.parser(query)
         self.assertEqual(expected, params)
+
+
+class TestBZQLTatsu(TestBZQL):
+    BACKEND = 'tatsu'
+
+
+@ddt.ddt
+class TestFastParser(testtools.TestCase):
+    def setUp(self):
+        super(TestFastParser, self).setUp()
+
+        self.tatsu_parser = bzql.parser('tatsu')
+
+    @ddt.data(
+        # Regular expression tokens aren't name guarded
+        'notes = 1',
+        'a = 1 android = 2',
+        'a=1 ornot b=2',
+        # Literal tokens are
+        'status containsx "a"',
+        'status contains_ "a"',
+        # Operators are passed through as written
+        'a EQUALS 1',
+        'a IN ["x"]',
+        'a = 1 AND b = 2',
+        # Whitespace
+        '  a = 1  ',
+        'a=1&b=2|!c=3',
+        'a = "x"or b = 1',
+        'a = " x"',
+        'a = "x "',
+        'a  =  "x  y"',
+        'a in [ "x" , 1.50, 01 ]',
+        # Nesting
+        '(a = 1)',
+        '!(a=1|b=2)',
+        'a = 1 and not b = 2 or ( c = 3 )',
+        '((a = 1 | b = 2) & !(c isempty | d ~ "x")) | e listofbugs [1,2]',
+        # Errors
+        '',
+        'a',
+        'a =',
+        'a = ""',
+        'a = [1]',
+        'a.b.c = 1',
+        'a1 = 1',
+        'not = 1',
+        'not not a = 1',
+        'a = 1 and',
+        'a = 1 b = 2',
+        'a = 1)',
+        '(a = 1',
+        'a listofbugs [1, 2.5]',
+    )
+    def test_matches_tatsu(self, query):
+        try:
+            expected = self.tatsu_parser(query)
+        except tatsu.exceptions.ParseError:
+            self.assertRaises(tatsu.exceptions.ParseError,
+                              bzql.parser(), query)
+        else:
+            params = bzql.parser()(query)
+            self.assertEqual(expected, params)
+            self.assertListEqual(list(expected.items()),
+                                 list(params.items()))
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, bzql.parser, 'unknown')
+
+
+class TestGrammarCache(testtools.TestCase):
+    def setUp(self):
+        super(TestGrammarCache, self).setUp()
+
+        self.cache_dir = self.useFixture(GrammarCacheFixture()).cache_dir
+
+    def test_compiled_once_per_process(self):
+        with mock.patch('tatsu.compile', wraps=tatsu.compile) as m:
+            bzql.parser('tatsu')
+            bzql.parser('tatsu')
+
+        m.assert_called_once()
+
+    def test_persisted_between_processes(self):
+        query = 'status = "NEW"'
+        expected = bzql.parser('tatsu')(query)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        # Simulate a new process
+        bzql._compiled_grammar.cache_clear()
+
+        with mock.patch('tatsu.compile') as m:
+            params = bzql.parser('tatsu')(query)
+
+        m.assert_not_called()
+        self.assertEqual(expected, params)
+
+    def test_corrupt_cache(self):
+        bzql.parser('tatsu')
+        cache_file, = os.listdir(self.cache_dir)
+        with open(os.path.join(self.cache_dir, cache_file), 'wb') as f:
+            f.write(b'garbage')
+
+        bzql._compiled_grammar.cache_clear()
+
+        with mock.patch('tatsu.compile', wraps=tatsu.compile) as m:
+            params = bzql.parser('tatsu')('status = "NEW"')
+
+        m.assert_called_once()
+        self.assertEqual({'f0': 'bug_status', 'o0': 'equals', 'v0': 'NEW'},
+                         params)
+
+    def test_unwritable_cache(self):
+        self.useFixture(fixtures.MockPatch(
+            'rhbztools.picklecache.cache_dir',
+            return_value=os.path.join(self.cache_dir, 'file', 'dir')))
+        with open(os.path.join(self.cache_dir, 'file'), 'w'):
+            pass
+
+        params = bzql.parser('tatsu')('status = "NEW"')
+        self.assertEqual({'f0': 'bug_status', 'o0': 'equals', 'v0': 'NEW'},
+                         params)
+
+
+class TestTranslate(testtools.TestCase):
+    def setUp(self):
+        super(TestTranslate, self).setUp()
+
+        bzql.translate.cache_clear()
+        self.addCleanup(bzql.translate.cache_clear)
+
+    def test_translate(self):
+        params = bzql.translate('status = "NEW"')
+        self.assertEqual({'f0': 'bug_status', 'o0': 'equals', 'v0': 'NEW'},
+                         dict(params))
+
+    def test_memoized(self):
+        first = bzql.translate('status = "NEW"')
+        second = bzql.translate('  status   =\n"NEW" ')
+
+        self.assertIs(first, second)
+        info = bzql.translate.cache_info()
+        self.assertEqual(1, info.hits)
+        self.assertEqual(1, info.misses)
+
+    def test_string_whitespace_significant(self):
+        params = bzql.translate('summary = "a  b"')
+        self.assertEqual('a  b', params['v0'])
+        params = bzql.translate('summary = "a b"')
+        self.assertEqual('a b', params['v0'])
+
+    def test_immutable(self):
+        params = bzql.translate('status = "NEW"')
+        with testtools.ExpectedException(TypeError):
+            params['include_fields'] = 'id'
+
+    def test_error_not_cached(self):
+        self.assertRaises(tatsu.exceptions.ParseError, bzql.translate,
+                          'status =')
+        self.assertEqual(0, bzql.translate.cache_info().currsize)
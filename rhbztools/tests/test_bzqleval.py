@@ -0,0 +1,106 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import ddt
+import testtools
+from unittest import mock
+
+from rhbztools import bzqleval
+
+BUGS = [
+    dict(id=1, status='NEW', priority='high', keywords=['Triaged'],
+         flags=[dict(name='rhos-17.0', status='+')],
+         summary='Instance fails to boot', cf_devel_whiteboard='NeedsAuto',
+         last_change_time='2019-03-01T00:00:00Z'),
+    dict(id=2, status='ASSIGNED', priority='low', keywords=[],
+         flags=[dict(name='rhos-16.0', status='?')],
+         summary='Volume attach is slow', cf_devel_whiteboard='',
+         last_change_time='2019-01-01T00:00:00Z'),
+    dict(id=3, status='POST', priority='high', keywords=['Regression'],
+         flags=[], summary='BOOT from volume broken',
+         cf_devel_whiteboard='NeedsAutoDoc foo',
+         last_change_time='2019-02-01T00:00:00Z'),
+]
+
+
+@ddt.ddt
+class TestCompileQuery(testtools.TestCase):
+    def _match(self, query):
+        return [bug['id'] for bug in bzqleval.compile_query(query).filter(BUGS)]
+
+    @ddt.data(
+        ('status = "NEW"', [1]),
+        ('status != "NEW"', [2, 3]),
+        ('status in ["NEW", "POST"]', [1, 3]),
+        ('priority = "high" and not status = "NEW"', [3]),
+        ('priority = "low" or keywords = "Regression"', [2, 3]),
+        ('(status = "NEW" or status = "POST") and ! priority = "high"', []),
+        ('flags contains "rhos-17.0+"', [1]),
+        ('summary substring "boot"', [1, 3]),
+        ('summary contains "boot"', [1]),
+        ('summary regexp "^vol"', [2]),
+        ('summary anywords ["boot", "slow"]', [1, 2, 3]),
+        ('summary allwords ["volume", "boot"]', [3]),
+        ('devel_whiteboard anywords ["NeedsAuto"]', [1]),
+        ('devel_whiteboard anywordssubstr ["NeedsAuto"]', [1, 3]),
+        ('keywords isempty', [2]),
+        ('devel_whiteboard isnotempty', [1, 3]),
+        ('bug_id listofbugs [1, 3, 5]', [1, 3]),
+        ('bug_id >= 2', [2, 3]),
+        ('bug_id < 3', [1, 2]),
+    )
+    @ddt.unpack
+    def test_match(self, query, expected):
+        self.assertEqual(expected, self._match(query))
+
+    def test_fields(self):
+        predicate = bzqleval.compile_query(
+            'status = "NEW" and flags contains "rhos" or short_desc = "x"')
+        self.assertEqual({'status', 'flags', 'summary'}, predicate.fields)
+
+    @ddt.data(
+        'status changedby "foo@example.com"',
+        'longdesc contains "boot"',
+    )
+    def test_unsupported(self, query):
+        self.assertRaises(bzqleval.UnsupportedQuery,
+                          bzqleval.compile_query, query)
+
+    def test_missing_field(self):
+        predicate = bzqleval.compile_query('component = "nova"')
+        self.assertRaises(bzqleval.MissingField, predicate, BUGS[0])
+
+
+class TestFilterBugs(testtools.TestCase):
+    def test_local(self):
+        session = mock.Mock()
+        bugs = bzqleval.filter_bugs('priority = "high"', BUGS, session)
+        self.assertEqual([1, 3], [bug['id'] for bug in bugs])
+        session.query.assert_not_called()
+
+    def test_unsupported_no_session(self):
+        self.assertRaises(bzqleval.UnsupportedQuery, bzqleval.filter_bugs,
+                          'status changedby "foo@example.com"', BUGS)
+
+    def test_server_fallback(self):
+        session = mock.Mock()
+        session.query.return_value = iter([dict(id=3), dict(id=4)])
+        query = 'status changedby "foo@example.com"'
+
+        bugs = bzqleval.filter_bugs(query, BUGS, session)
+
+        self.assertEqual([3], [bug['id'] for bug in bugs])
+        session.query.assert_called_once_with(query, fields=['id'])
@@ -0,0 +1,97 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import ddt
+import testtools
+
+from rhbztools import bzql
+from rhbztools import bzqlplan
+
+
+@ddt.ddt
+class TestPlan(testtools.TestCase):
+    def test_split(self):
+        plan = bzqlplan.plan('status = "NEW" and summary ~ "boot.*fail" and '
+                             'not devel_whiteboard contains "NeedsAuto"')
+
+        self.assertEqual(dict(bzql.translate('status = "NEW"')),
+                         dict(plan.params))
+        self.assertEqual({'summary', 'cf_devel_whiteboard'}, plan.fields)
+
+        bugs = [
+            dict(id=1, summary='boot did fail', cf_devel_whiteboard=''),
+            dict(id=2, summary='boot ok', cf_devel_whiteboard=''),
+            dict(id=3, summary='boot fail', cf_devel_whiteboard='NeedsAuto'),
+        ]
+        self.assertEqual([1], [bug['id'] for bug in plan.filter(bugs)])
+
+    def test_nested_or(self):
+        plan = bzqlplan.plan('product = "OSP" and '
+                             '(a = "1" or (b = "2" or c = "3"))')
+        self.assertEqual(dict(bzql.translate('product = "OSP"')),
+                         dict(plan.params))
+        self.assertEqual({'a', 'b', 'c'}, plan.fields)
+
+    @ddt.data(
+        # Nothing slow
+        'status = "NEW" and component = "nova"',
+        # No selective predicate
+        'summary ~ "boot"',
+        # Top level or group
+        'status = "NEW" or summary ~ "boot"',
+        # Text search on a short field
+        'status = "NEW" and component contains "nova"',
+        # Slow, but can't be evaluated locally
+        'status = "NEW" and longdesc regexp "boot"',
+    )
+    def test_server_only(self, query):
+        plan = bzqlplan.plan(query)
+        self.assertIsNone(plan.predicate)
+        self.assertEqual(dict(bzql.translate(query)), dict(plan.params))
+
+        bugs = [dict(id=1)]
+        self.assertIs(bugs, plan.filter(bugs))
+
+    def test_explain(self):
+        plan = bzqlplan.plan('status in ["NEW", "POST"] and summary ~ "boot"')
+        self.assertEqual(
+            'Query: status in ["NEW", "POST"] and summary ~ "boot"\n'
+            'Server:\n'
+            '  status in ["NEW", "POST"]\n'
+            '    f0=bug_status\n'
+            '    o0=anyexact\n'
+            '    v0=NEW, POST\n'
+            'Client:\n'
+            '  summary ~ "boot"  [regexp]\n'
+            '  fields: summary',
+            plan.explain())
+
+    @ddt.data(
+        'a = "1"',
+        'not a = 1 and b in ["x", "y"]',
+        'a = "1" or (b = "2" and c isempty) or not (d ~ "x")',
+        'blocks listofbugs [1, 2]',
+        'a in [1, "x y", 2.5]',
+    )
+    def test_format_tree(self, query):
+        formatted = bzqlplan.format_tree(bzql.parse(query))
+        self.assertEqual(bzql.parse(query), bzql.parse(formatted))
+
+    def test_format_list(self):
+        self.assertEqual(
+            'blocks listofbugs [1, 2] and a in [1, "x y"]',
+            bzqlplan.format_tree(bzql.parse(
+                'blocks listofbugs [1,2] and a in ["1", "x y"]')))
@@ -0,0 +1,61 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+
+import ddt
+import io
+import json
+import testtools
+
+from rhbztools import bzquery
+from rhbztools import records
+
+BUGS = [
+    {'id': 1, 'status': 'NEW', 'keywords': ['Triaged'],
+     'summary': 'One, "quoted"\n'},
+    {'id': 2, 'status': 'POST', 'keywords': [], 'pm_score': None},
+    {'id': 3, 'flags': [{'name': 'needinfo', 'status': '?'}]},
+]
+
+
+@ddt.ddt
+class TestWriters(testtools.TestCase):
+    def _write(self, writer, bugs):
+        out = io.StringIO()
+        writer(iter(bugs), out)
+        return out.getvalue()
+
+    @ddt.data([], BUGS[:1], BUGS)
+    def test_write_json(self, bugs):
+        # The same as printing the whole result
+        self.assertEqual(json.dumps(list(bugs)) + '\n',
+                         self._write(bzquery.write_json, bugs))
+
+    def test_write_json_records(self):
+        self.assertEqual(json.dumps(BUGS) + '\n',
+                         self._write(bzquery.write_json,
+                                     records.compact(BUGS)))
+
+    @ddt.data([], BUGS)
+    def test_write_ndjson(self, bugs):
+        lines = self._write(bzquery.write_ndjson, bugs).splitlines()
+        self.assertEqual(len(bugs), len(lines))
+        self.assertEqual(bugs, [json.loads(line) for line in lines])
+
+    def test_write_ndjson_records(self):
+        self.assertEqual(
+            ''.join(json.dumps(bug) + '\n' for bug in BUGS),
+            self._write(bzquery.write_ndjson, records.compact(BUGS)))
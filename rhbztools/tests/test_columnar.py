@@ -0,0 +1,149 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import fixtures
+import io
+import testtools
+
+from rhbztools import columnar
+from rhbztools import records
+
+BUGS = [
+    {'id': 1, 'status': 'NEW', 'keywords': ['Triaged', 'Regression'],
+     'summary': 'One, "quoted"'},
+    {'id': 2, 'status': 'POST', 'keywords': []},
+]
+
+
+class TestCSV(testtools.TestCase):
+    def test_write_csv(self):
+        out = io.StringIO()
+        columnar.write_csv(iter(BUGS), out, ['summary', 'status', 'keywords'])
+        self.assertEqual(
+            'id,summary,status,keywords\n'
+            '1,"One, ""quoted""",NEW,"[""Triaged"", ""Regression""]"\n'
+            '2,,POST,[]\n',
+            out.getvalue())
+
+    def test_write_csv_records(self):
+        out = io.StringIO()
+        columnar.write_csv(records.compact(BUGS), out, ['id', 'status'])
+        self.assertEqual('id,status\n1,NEW\n2,POST\n', out.getvalue())
+
+
+class TestArrow(testtools.TestCase):
+    def setUp(self):
+        super(TestArrow, self).setUp()
+
+        if columnar.pyarrow is None:
+            self.skipTest('pyarrow is not installed')
+
+    def _bugs(self, n):
+        # summary is null for every bug in the first batch
+        return ({'id': i, 'status': 'NEW', 'keywords': ['Triaged'],
+                 'summary': 'Bug {i}'.format(i=i) if i > 2 else None}
+                for i in range(n))
+
+    def test_write_parquet(self):
+        out = io.BytesIO()
+        columnar.write_parquet(self._bugs(5), out, ['status', 'summary'],
+                               batch_size=2)
+
+        out.seek(0)
+        table = columnar.pyarrow.parquet.read_table(out)
+        self.assertEqual(['id', 'status', 'summary'], table.column_names)
+        self.assertEqual(list(range(5)), table.column('id').to_pylist())
+        self.assertEqual([None, None, None, 'Bug 3', 'Bug 4'],
+                         table.column('summary').to_pylist())
+
+    def test_write_arrow(self):
+        out = io.BytesIO()
+        columnar.write_arrow(self._bugs(3), out, ['keywords'])
+
+        out.seek(0)
+        table = columnar.pyarrow.ipc.open_stream(out).read_all()
+        self.assertEqual([['Triaged']] * 3,
+                         table.column('keywords').to_pylist())
+
+    def _read_arrow(self, bugs, fields):
+        out = io.BytesIO()
+        columnar.write_arrow(iter(bugs), out, fields, batch_size=1)
+
+        out.seek(0)
+        return columnar.pyarrow.ipc.open_stream(out).read_all()
+
+    def test_write_arrow_late_int(self):
+        table = self._read_arrow([{'id': 1, 'pm_score': None},
+                                  {'id': 2, 'pm_score': 5}], ['pm_score'])
+        self.assertEqual(columnar.pyarrow.int64(),
+                         table.schema.field('pm_score').type)
+        self.assertEqual([None, 5], table.column('pm_score').to_pylist())
+
+    def test_write_arrow_late_list(self):
+        table = self._read_arrow([{'id': 1, 'blocks': []},
+                                  {'id': 2, 'blocks': [5]}], ['blocks'])
+        self.assertEqual(columnar.pyarrow.list_(columnar.pyarrow.int64()),
+                         table.schema.field('blocks').type)
+        self.assertEqual([[], [5]], table.column('blocks').to_pylist())
+
+    def test_write_arrow_late_struct(self):
+        flags = [{'name': 'needinfo', 'setter': None},
+                 {'name': 'needinfo', 'setter': 'user@example.com'}]
+        table = self._read_arrow([{'id': 1, 'flag': None},
+                                  {'id': 2, 'flag': flags[0]},
+                                  {'id': 3, 'flag': flags[1]}], ['flag'])
+        self.assertEqual([None] + flags, table.column('flag').to_pylist())
+
+    def test_write_arrow_null(self):
+        # Columns which are only ever null or empty are strings
+        table = self._read_arrow([{'id': 1, 'blocks': []},
+                                  {'id': 2, 'blocks': []}],
+                                 ['blocks', 'pm_score'])
+        self.assertEqual(columnar.pyarrow.list_(columnar.pyarrow.string()),
+                         table.schema.field('blocks').type)
+        self.assertEqual(columnar.pyarrow.string(),
+                         table.schema.field('pm_score').type)
+
+    def test_write_arrow_infer_limit(self):
+        # Columns whose type isn't known after INFER_BATCHES are JSON
+        self.useFixture(fixtures.MockPatch(
+            'rhbztools.columnar.INFER_BATCHES', 2))
+        bugs = [{'id': 1, 'blocks': []}, {'id': 2, 'blocks': []},
+                {'id': 3, 'blocks': [5]}, {'id': 4, 'blocks': None}]
+        table = self._read_arrow(bugs, ['blocks'])
+        self.assertEqual(columnar.pyarrow.string(),
+                         table.schema.field('blocks').type)
+        self.assertEqual(['[]', '[]', '[5]', None],
+                         table.column('blocks').to_pylist())
+
+    def test_write_parquet_late_int(self):
+        out = io.BytesIO()
+        columnar.write_parquet(iter([{'id': 1, 'pm_score': None},
+                                     {'id': 2, 'pm_score': 5}]),
+                               out, ['pm_score'], batch_size=1)
+
+        out.seek(0)
+        table = columnar.pyarrow.parquet.read_table(out)
+        self.assertEqual([None, 5], table.column('pm_score').to_pylist())
+
+    def test_write_arrow_empty(self):
+        out = io.BytesIO()
+        columnar.write_arrow(iter([]), out, ['status'])
+
+        out.seek(0)
+        table = columnar.pyarrow.ipc.open_stream(out).read_all()
+        self.assertEqual(['id', 'status'], table.column_names)
+        self.assertEqual(0, table.num_rows)
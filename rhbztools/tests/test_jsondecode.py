@@ -0,0 +1,95 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import ddt
+import json
+import testtools
+
+from rhbztools import jsondecode
+
+DOC = {
+    'faults': [],
+    'nested': {'bugs': [0]},
+    'bugs': [{'id': i, 'summary': 'Bug "{i}" \\ é'.format(i=i),
+              'keywords': [{'bugs': []}], 'score': 1.5e3} for i in range(20)],
+    'total': 12345,
+}
+
+
+def _chunks(doc, size):
+    data = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+    return iter([data[i:i + size] for i in range(0, len(data), size)])
+
+
+@ddt.ddt
+class TestIterArray(testtools.TestCase):
+    @ddt.data(1, 2, 7, 100, 100000)
+    def test_elements(self, size):
+        (bugs, document) = jsondecode.iter_array(_chunks(DOC, size), 'bugs')
+        self.assertIsNone(document)
+        self.assertEqual(DOC['bugs'], list(bugs))
+
+    @ddt.data(
+        {'error': True, 'message': 'bugs "bugs"', 'code': 32000},
+        {'key': 'bugs', 'nested': {'bugs': []}},
+        {},
+    )
+    def test_no_key(self, doc):
+        for size in (1, 3, 100):
+            (bugs, document) = jsondecode.iter_array(_chunks(doc, size),
+                                                     'bugs')
+            self.assertIsNone(bugs)
+            self.assertEqual(doc, document)
+
+    def test_number_split(self):
+        (bugs, _) = jsondecode.iter_array(iter([b'{"bugs": [12', b'34]}']),
+                                          'bugs')
+        self.assertEqual([1234], list(bugs))
+
+    def test_empty(self):
+        (bugs, _) = jsondecode.iter_array(iter([b'{"bugs": [ ]}']), 'bugs')
+        self.assertEqual([], list(bugs))
+
+    def test_truncated(self):
+        (bugs, _) = jsondecode.iter_array(iter([b'{"bugs": [{"id": 1}, {']),
+                                          'bugs')
+        self.assertEqual({'id': 1}, next(bugs))
+        self.assertRaises(ValueError, next, bugs)
+
+    @ddt.data(b'{"bugs": [{"id": 1},', b'{"bugs": [{"id": 1}, ',
+              b'{"bugs": [{"id": 1}')
+    def test_truncated_between_elements(self, doc):
+        (bugs, _) = jsondecode.iter_array(iter([doc]), 'bugs')
+        self.assertEqual({'id': 1}, next(bugs))
+        self.assertRaises(ValueError, next, bugs)
+
+    @ddt.data(b'{"bugs": ', b'{"bugs": [')
+    def test_truncated_start(self, doc):
+        (bugs, _) = jsondecode.iter_array(iter([doc]), 'bugs')
+        self.assertRaises(ValueError, next, bugs)
+
+
+class TestDecoder(testtools.TestCase):
+    def test_default(self):
+        self.assertIs(jsondecode.DECODERS[jsondecode.DEFAULT],
+                      jsondecode.decoder())
+        self.assertEqual(DOC, jsondecode.loads(json.dumps(DOC).encode()))
+
+    def test_json(self):
+        self.assertEqual(DOC, jsondecode.decoder('json')(json.dumps(DOC)))
+
+    def test_unavailable(self):
+        self.assertRaises(ValueError, jsondecode.decoder, 'simdjson')
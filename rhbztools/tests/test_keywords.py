@@ -16,6 +16,9 @@
 # along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
 
 import contextlib
+import os
+import os.path
+import tempfile
 import unittest
 import unittest.mock
 
@@ -103,3 +106,122 @@ class TestKeywords(unittest.TestCase):
         add = ['unicorns']
         with self.assertRaises(keywords.InvalidKeyword):
             self.keywords.update_string('', add, [])
+
+    def test_updater_reuse(self):
+        # An updater gives the same result for a whiteboard regardless of
+        # the whiteboards it updated before
+        updater = self.keywords.updater(['noqe'], ['hardware'])
+        self.assertIsNone(updater('QENotRequired'))
+        self.assertEqual('QENotRequired', updater(''))
+        self.assertEqual('BlockedOtherDFG QENotRequired',
+                         updater('otherdfg hardware'))
+        self.assertIsNone(updater('QENotRequired'))
+
+    def test_updater_adds_after_present(self):
+        # Regression test: the updater used to remove a word to add from its
+        # set of words to add when it found it in a whiteboard, so it was
+        # never added to any later whiteboard
+        updater = self.keywords.updater(['noqe'])
+        self.assertIsNone(updater('foo QENotRequired'))
+        self.assertEqual('foo QENotRequired', updater('foo'))
+        self.assertEqual('QENotRequired', updater(''))
+
+    def test_add_and_remove(self):
+        updater = self.keywords.updater(['noqe'], ['QENotRequired'])
+        self.assertEqual('foo QENotRequired', updater('noqe foo'))
+
+    def test_update_all(self):
+        updater = self.keywords.updater(['noqe'], ['hardware'])
+        whiteboards = ['', 'QENotRequired', 'hardware', '', 'foo  bar',
+                       'QENotRequired']
+        self.assertListEqual([updater(wb) for wb in whiteboards],
+                             updater.update_all(whiteboards))
+        self.assertListEqual(
+            ['QENotRequired', None, 'QENotRequired', 'QENotRequired',
+             'foo bar QENotRequired', None],
+            updater.update_all(whiteboards))
+
+
+class TestKeywordsLoad(unittest.TestCase):
+    CONTENT = '# Keywords\nQENotRequired noqe\n\nBlockedHardware hardware\n'
+
+    def setUp(self):
+        super(TestKeywordsLoad, self).setUp()
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+
+        patcher = unittest.mock.patch('rhbztools.picklecache.cache_dir',
+                                      return_value=os.path.join(self.tmpdir,
+                                                                'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.path = os.path.join(self.tmpdir, 'keywords')
+        self._write(self.CONTENT)
+
+    def _write(self, content, mtime_ns=None):
+        with open(self.path, 'w') as f:
+            f.write(content)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def _load(self):
+        with unittest.mock.patch.object(keywords.Keywords, '__init__',
+                                        side_effect=keywords.Keywords.__init__,
+                                        autospec=True) as init:
+            loaded = keywords.Keywords.load(self.path)
+        return (loaded, init.call_count > 0)
+
+    def test_load(self):
+        (loaded, indexed) = self._load()
+        self.assertTrue(indexed)
+        expected = keywords.Keywords(keywords.LineReader(self.path))
+        self.assertDictEqual(expected.constants, loaded.constants)
+        self.assertEqual('QENotRequired',
+                         loaded.update_string('', ['noqe']))
+
+    def test_cached(self):
+        self._load()
+        (loaded, indexed) = self._load()
+        self.assertFalse(indexed)
+        self.assertEqual('BlockedHardware', loaded.constants['hardware'])
+
+    def test_modified(self):
+        self._load()
+        self._write(self.CONTENT + 'BlockedOtherDFG otherdfg\n')
+
+        (loaded, indexed) = self._load()
+        self.assertTrue(indexed)
+        self.assertEqual('BlockedOtherDFG', loaded.constants['otherdfg'])
+
+    def test_touched(self):
+        # A new modification time with the same content reuses the index
+        self._write(self.CONTENT, mtime_ns=1000000000)
+        self._load()
+        self._write(self.CONTENT, mtime_ns=2000000000)
+
+        (loaded, indexed) = self._load()
+        self.assertFalse(indexed)
+        self.assertEqual('QENotRequired', loaded.constants['noqe'])
+
+    def test_modified_same_size(self):
+        self._write(self.CONTENT, mtime_ns=1000000000)
+        self._load()
+        self._write(self.CONTENT.replace('noqe', 'noqa'), mtime_ns=1000000001)
+
+        (loaded, indexed) = self._load()
+        self.assertTrue(indexed)
+        self.assertIn('noqa', loaded.constants)
+
+    def test_unreadable_index(self):
+        self._load()
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), 'wb') as f:
+                f.write(b'garbage')
+
+        (loaded, indexed) = self._load()
+        self.assertTrue(indexed)
+        self.assertEqual('QENotRequired', loaded.constants['noqe'])
@@ -0,0 +1,80 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import pickle
+import testtools
+
+from rhbztools import records
+
+BUGS = [
+    {'id': 1, 'status': 'NEW', 'keywords': ['Triaged'], 'flags': []},
+    {'id': 2, 'status': 'NEW', 'summary': 'Two'},
+]
+
+
+class TestBugTable(testtools.TestCase):
+    def setUp(self):
+        super(TestBugTable, self).setUp()
+
+        self.table = records.BugTable()
+        self.table.extend(BUGS)
+
+    def test_dict_access(self):
+        record = self.table[0]
+        self.assertEqual(1, record['id'])
+        self.assertEqual(['Triaged'], record['keywords'])
+        self.assertEqual('default', record.get('summary', 'default'))
+        self.assertRaises(KeyError, lambda: record['summary'])
+        self.assertEqual(['id', 'status', 'keywords', 'flags'], list(record))
+        self.assertEqual(4, len(record))
+
+    def test_attribute_access(self):
+        record = self.table[1]
+        self.assertEqual('Two', record.summary)
+        self.assertRaises(AttributeError, getattr, record, 'keywords')
+
+    def test_round_trip(self):
+        self.assertEqual(BUGS, [record.to_dict() for record in self.table])
+        self.assertEqual(BUGS, list(self.table))
+        self.assertEqual(json.dumps(BUGS),
+                         json.dumps(list(self.table),
+                                    default=records.to_json))
+
+    def test_interned(self):
+        status = ''.join(['N', 'E', 'W'])
+        record = self.table.append({'id': 3, 'status': status})
+        self.assertIs(self.table[0]['status'], record['status'])
+
+    def test_len(self):
+        self.assertEqual(2, len(self.table))
+        self.assertRaises(IndexError, lambda: self.table[2])
+
+    def test_pickle(self):
+        record = pickle.loads(pickle.dumps(self.table[1]))
+        self.assertEqual(BUGS[1], record.to_dict())
+
+
+class TestCompact(testtools.TestCase):
+    def test_compact(self):
+        compacted = records.compact(iter(BUGS))
+        record = next(compacted)
+        self.assertIsInstance(record, records.BugRecord)
+        self.assertEqual(BUGS, [record] + list(compacted))
+
+    def test_to_json_error(self):
+        self.assertRaises(TypeError, json.dumps, object(),
+                          default=records.to_json)
@@ -0,0 +1,91 @@
+# Copyright 2019 Red Hat, Inc
+#
+# This file is part of rhbztools.
+#
+# rhbztools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# rhbztools is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with rhbztools.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import testtools
+
+from rhbztools import bzql
+from rhbztools import stats
+from rhbztools.tests import GrammarCacheFixture
+
+
+def _request(method='GET', endpoint='bug', status=200, retries=0):
+    return stats.RequestStats(method=method, endpoint=endpoint,
+                              status=status, size=100, retries=retries,
+                              ttfb=0.5, download=0.25, decode=0.125,
+                              total=1.0)
+
+
+class TestStats(testtools.TestCase):
+    def setUp(self):
+        super(TestStats, self).setUp()
+
+        self.stats = stats.Stats()
+        self.stats(_request())
+        self.stats(_request(status=500, retries=2))
+        self.stats(_request(method='PUT', endpoint='bug/{id}'))
+        self.stats(bzql.ParseStats('status = "NEW"', parse=0.5, walk=0.25))
+
+    def test_endpoint(self):
+        self.assertEqual('bug/{id}', stats.endpoint(['bug', '12345']))
+        self.assertEqual('valid_login', stats.endpoint(['valid_login']))
+
+    def test_to_dict(self):
+        self.assertEqual({
+            'requests': [
+                {'method': 'GET', 'endpoint': 'bug', 'count': 2, 'size': 200,
+                 'retries': 2, 'errors': 1, 'ttfb': 1.0, 'download': 0.5,
+                 'decode': 0.25, 'total': 2.0},
+                {'method': 'PUT', 'endpoint': 'bug/{id}', 'count': 1,
+                 'size': 100, 'retries': 0, 'errors': 0, 'ttfb': 0.5,
+                 'download': 0.25, 'decode': 0.125, 'total': 1.0},
+            ],
+            'bzql': {'count': 1, 'parse': 0.5, 'walk': 0.25},
+        }, self.stats.to_dict())
+        self.assertEqual(self.stats.to_dict(),
+                         json.loads(self.stats.to_json()))
+
+    def test_to_prometheus(self):
+        lines = self.stats.to_prometheus().split('\n')
+        self.assertIn('# TYPE rhbztools_requests_total counter', lines)
+        self.assertIn('rhbztools_requests_total'
+                      '{method="GET",endpoint="bug"} 2', lines)
+        self.assertIn('rhbztools_request_seconds_total'
+                      '{method="PUT",endpoint="bug/{id}",phase="ttfb"} 0.5',
+                      lines)
+        self.assertIn('rhbztools_request_retries_total'
+                      '{method="GET",endpoint="bug"} 2', lines)
+        self.assertIn('rhbztools_bzql_queries_total 1', lines)
+        self.assertIn('rhbztools_bzql_seconds_total{phase="walk"} 0.25',
+                      lines)
+
+
+class TestParseHooks(testtools.TestCase):
+    def test_hooks(self):
+        self.useFixture(GrammarCacheFixture())
+
+        collected = []
+        self.addCleanup(bzql.hooks.remove, collected.append)
+        bzql.hooks.append(collected.append)
+
+        for backend in ('fast', 'tatsu'):
+            bzql.parser(backend)('status = "NEW"')
+
+        self.assertEqual(2, len(collected))
+        for parse_stats in collected:
+            self.assertEqual('status = "NEW"', parse_stats.query)
+            self.assertGreater(parse_stats.parse, 0)
+            self.assertGreater(parse_stats.walk, 0)
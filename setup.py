@@ -27,6 +27,11 @@ setup(
         'requests',
         'tatsu',
     ],
+    extras_require = {
+        'arrow': ['pyarrow'],
+        'async': ['aiohttp'],
+        'fastjson': ['orjson'],
+    },
     entry_points = {
         'console_scripts': [
             'bzdevelwb = rhbztools.bzdevelwb:main',
@@ -35,5 +40,6 @@ setup(
     },
     include_package_data=True,
     test_suite = 'rhbztools.tests.all_tests',
-    tests_require = ['testtools', 'requests-mock', 'ddt'],
+    tests_require = ['testtools', 'requests-mock', 'ddt', 'aiohttp',
+                     'aioresponses'],
 )